@@ -0,0 +1,192 @@
+"""
+    Headless batch mode: OCR and summarize every image/PDF found in the given directories or globs.
+    Each finished or failed file is appended to a JSONL manifest; running again with the same manifest
+    skips files already marked done, so interrupted runs resume where they stopped.
+
+    python batch_cli.py scans/ "inbox/**/*.pdf" --manifest nightly.jsonl --output-dir results/
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from pipeline import DocumentPipeline, HIGH_DPI, LOW_DPI, MIN_CONFIDENCE
+from ocr_pool import OCRPool, default_worker_count
+from utils import set_tesseract_path, SUPPORTED_EXTENSIONS
+from preprocessing import BLANK_INK_RATIO, PRESETS
+from result_store import ResultStore
+from page_hash import DEFAULT_MAX_DISTANCE, PageHashIndex
+from llm_client import shared_rate_limiter
+import metrics
+
+def find_documents(inputs):
+    found = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                found.extend(os.path.join(root, name) for name in files)
+        else:
+            found.extend(glob.glob(item, recursive=True) or [item])
+    documents = [os.path.abspath(path) for path in found if path.lower().endswith(SUPPORTED_EXTENSIONS)]
+    return sorted(set(documents))
+
+def load_completed(manifest_path):
+    completed = set()
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A run killed mid-write leaves a partial last line
+                    continue
+                if record.get("status") == "done":
+                    completed.add(record["path"])
+    return completed
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def append(self, record):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+def output_stem(output_dir, path):
+    # The path hash keeps equally named files from different folders apart
+    digest = hashlib.sha1(path.encode()).hexdigest()[:10]
+    return os.path.join(output_dir, f"{os.path.splitext(os.path.basename(path))[0]}.{digest}")
+
+def process_document(path, args, pool, page_index=None, rate_limiter=None):
+    record = {"path": path, "started": time.time()}
+    try:
+        pipeline = DocumentPipeline(
+            path,
+            args.api_key,
+            args.organization,
+            ocr_engine=args.ocr_engine,
+            preprocess=args.preprocess,
+            use_cache=not args.no_cache,
+            refresh_summary=args.refresh_summary,
+            summarize=not args.no_summary,
+            pool=pool,
+            blank_threshold=args.blank_threshold or None,
+            adaptive_dpi=args.adaptive_dpi,
+            min_confidence=args.min_confidence,
+            page_index=page_index,
+            rate_limiter=rate_limiter,
+        )
+        page_texts, summary = pipeline.run()
+        stem = output_stem(args.output_dir, path)
+        record["text_file"] = f"{stem}.txt"
+        with open(record["text_file"], "w", encoding="utf-8") as f:
+            f.write("\n".join(page_texts))
+        if summary is not None:
+            record["summary_file"] = f"{stem}.summary.txt"
+            with open(record["summary_file"], "w", encoding="utf-8") as f:
+                f.write(summary)
+        if not args.no_store:
+            # Each worker thread uses its own connection; one transaction per document
+            with ResultStore(args.store) as store:
+                record["document_id"] = store.save_document(path, page_texts, summary, pipeline.report)
+        record.update(pipeline.report)
+        record["status"] = "done"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["finished"] = time.time()
+    record["seconds"] = round(record["finished"] - record["started"], 3)
+    return record
+
+def run(args):
+    documents = find_documents(args.inputs)
+    completed = load_completed(args.manifest)
+    pending = [path for path in documents if path not in completed]
+    print(f"{len(documents)} documents, {len(documents) - len(pending)} already done, {len(pending)} to process")
+    if not pending:
+        return 0
+
+    args.output_dir = os.path.abspath(args.output_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest = Manifest(args.manifest)
+    failed = 0
+    # With --dedupe, repeated cover sheets and boilerplate pages anywhere in the batch are OCR'd once
+    page_index = PageHashIndex(args.dedupe_distance) if args.dedupe else None
+    # All documents in flight draw on one LLM request/token budget, whatever --workers is
+    rate_limiter = shared_rate_limiter()
+    # One OCR process pool is shared by all documents in flight
+    with OCRPool(args.ocr_workers, engine=args.ocr_engine, preprocess=args.preprocess) as pool:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(process_document, path, args, pool, page_index, rate_limiter) for path in pending]
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    record = future.result()
+                    manifest.append(record)
+                    if record["status"] != "done":
+                        failed += 1
+                    print(f"[{done}/{len(pending)}] {record['status']} {record['path']} ({record['seconds']}s)")
+            except KeyboardInterrupt:
+                print("Interrupted, finishing documents in progress; run again to resume")
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+    if page_index is not None:
+        stats = page_index.stats()
+        print(f"Near-duplicate pages: {stats['hits']} of {stats['lookups']} pages checked reused earlier text "
+              f"({stats['hit_rate']:.1%}, max distance {stats['max_distance']}, "
+              f"{stats['rejected']} hash matches rejected on pixels)")
+    if args.metrics_file:
+        metrics.write_metrics_file(args.metrics_file)
+    return 1 if failed else 0
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="OCR and summarize documents in bulk without the GUI")
+    parser.add_argument("inputs", nargs="+", help="directories, files or glob patterns")
+    parser.add_argument("--manifest", default="manifest.jsonl", help="JSONL file recording per-file status")
+    parser.add_argument("--output-dir", default=os.path.join(os.path.expanduser("~"), "Documents", "openai_ocr", "batch"))
+    parser.add_argument("--workers", type=int, default=2, help="documents processed at the same time")
+    parser.add_argument("--ocr-workers", type=int, default=default_worker_count(), help="OCR processes")
+    parser.add_argument("--ocr-engine", default="auto")
+    parser.add_argument("--preprocess", default="grayscale", choices=sorted(PRESETS))
+    parser.add_argument("--blank-threshold", type=float, default=BLANK_INK_RATIO,
+                        help="ink ratio below which a page is skipped as blank, 0 OCRs every page")
+    parser.add_argument("--adaptive-dpi", action="store_true",
+                        help=f"OCR PDF pages at {LOW_DPI} DPI and redo low-confidence pages at {HIGH_DPI} DPI")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE,
+                        help="mean word confidence (0-100) below which --adaptive-dpi redoes a page")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="reuse the OCR text of pages seen earlier, when hash and pixels both match")
+    parser.add_argument("--dedupe-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                        help="with --dedupe, max perceptual-hash distance (of 255 bits) checked against the pixels")
+    parser.add_argument("--metrics-log", default=os.getenv("OCRGPT_METRICS_LOG"), help="JSON lines file of stage timings")
+    parser.add_argument("--metrics-file", default=os.getenv("OCRGPT_METRICS_FILE"),
+                        help="Prometheus text file written when the run ends")
+    parser.add_argument("--tesseract-path", default=None)
+    parser.add_argument("--api-key", default=os.getenv("OPENAI_API_KEY"))
+    parser.add_argument("--organization", default=os.getenv("OPENAI_ORGANIZATION"))
+    parser.add_argument("--no-summary", action="store_true", help="only extract text")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--store", default=None, help="searchable result database, defaults to the GUI's")
+    parser.add_argument("--no-store", action="store_true", help="only write the text and summary files")
+    parser.add_argument("--refresh-summary", action="store_true", help="ignore cached summaries")
+    args = parser.parse_args(argv)
+
+    if not args.no_summary and not args.api_key:
+        parser.error("an OpenAI API key is required (--api-key or OPENAI_API_KEY), or pass --no-summary")
+    if args.tesseract_path:
+        set_tesseract_path(args.tesseract_path)
+    if args.metrics_log or args.metrics_file:
+        metrics.METRICS.enable(args.metrics_log)
+    return run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,450 @@
+"""
+    Offline benchmark of the whole pipeline on a generated corpus. Pages of deterministic text are
+    rendered to images and PDFs (several DPIs, page counts and noise levels, one PDF with a real text
+    layer, one with blank and repeated pages), then processed like the batch CLI does with --dedupe,
+    with the LLM replaced by the local stub at a chosen latency.
+
+    Reports pages/sec, p50/p95 per stage, peak RSS, the near-duplicate hit rate and character accuracy
+    against the rendered text,
+    and compares them with a stored baseline:
+
+    python benchmark.py --save-baseline              # record the current numbers
+    python benchmark.py --latency 0.2 --workers 4    # later: compare against them
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from aiohttp import web
+import metrics
+from llm_stub import StubLLM
+from ocr_pool import OCRPool, default_worker_count
+from page_hash import DEFAULT_MAX_DISTANCE, PageHashIndex
+from pipeline import DocumentPipeline
+from preprocessing import PRESETS, char_accuracy
+
+CORPUS_VERSION = 3
+WORDS = (
+    "the invoice total amount due payment terms conditions customer account number date period "
+    "service agreement delivery order report quarter revenue balance statement contract notice "
+    "shall party provide within days upon receipt following section annual summary reference"
+).split()
+FONT_CANDIDATES = ("DejaVuSans.ttf", "arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf", "Helvetica.ttc")
+
+# Line of the form letter template that ends in an amount
+AMOUNT_LINE = 10
+
+# name, format, pages, dpi, noise (gray level std), skew (degrees), text layer
+DOCUMENTS = [
+    ("clean_200dpi", "pdf", 4, 200, 0, 0.0, False),
+    ("noisy_200dpi", "pdf", 4, 200, 18, 0.8, False),
+    ("lowres_150dpi", "pdf", 3, 150, 6, 0.3, False),
+    ("highres_300dpi", "pdf", 2, 300, 6, 0.3, False),
+    ("long_200dpi", "pdf", 12, 200, 8, 0.4, False),
+    ("text_layer", "pdf", 6, 200, 0, 0.0, True),
+    ("blank_and_repeats", "pdf", 6, 200, 8, 0.3, False),
+    ("photo_page", "jpg", 1, 200, 12, 0.6, False),
+    ("clean_page", "png", 1, 300, 0, 0.0, False),
+    # One letter template: the original, a noisy re-scan of it, another amount on one line and a
+    # replaced line. Only the re-scan may reuse the original's text.
+    ("form_letter", "png", 1, 200, 0, 0.0, False),
+    ("form_letter_rescan", "png", 1, 200, 8, 0.0, False),
+    ("form_letter_amount", "png", 1, 200, 0, 0.0, False),
+    ("form_letter_line", "png", 1, 200, 0, 0.0, False),
+]
+
+def _font(size):
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+def page_lines(rng, count):
+    lines = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(5, 8))]
+        words[0] = words[0].capitalize()
+        if rng.random() < 0.4:
+            words.insert(rng.randint(1, len(words) - 1), str(rng.randint(10, 99999)))
+        lines.append(" ".join(words) + ".")
+    return lines
+
+def render_page(lines, dpi, noise, skew, rng):
+    # US Letter with one-inch margins, 11pt text
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    font = _font(int(11 / 72 * dpi))
+    line_height = int(16 / 72 * dpi)
+    for i, line in enumerate(lines):
+        draw.text((dpi, dpi + i * line_height), line, fill=0, font=font)
+    page = np.asarray(image)
+    if skew:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), rng.uniform(-skew, skew), 1.0)
+        page = cv2.warpAffine(page, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=255)
+    if noise:
+        noisy = page.astype(np.int16) + np.random.default_rng(rng.randint(0, 2 ** 32)).normal(0, noise, page.shape).astype(np.int16)
+        page = np.clip(noisy, 0, 255).astype(np.uint8)
+    return Image.fromarray(page)
+
+def _pdf_string(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_text_layer_pdf(path, pages):
+    # Minimal hand-written PDF: Helvetica text on letter-sized pages, which pdftotext reads back
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 11 Tf 16 TL 72 720 Td " + " ".join(f"({_pdf_string(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {len(objects)} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(data)
+
+def generate_corpus(corpus_dir, seed=0):
+    # Same seed, same files: the manifest records what was generated so it is only built once
+    manifest_path = os.path.join(corpus_dir, "corpus.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == CORPUS_VERSION and manifest.get("seed") == seed:
+            return manifest
+        shutil.rmtree(corpus_dir)
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = random.Random(seed)
+    template = page_lines(rng, 40)
+    template[AMOUNT_LINE] = template[AMOUNT_LINE][:-1] + " 512.00."
+    documents = []
+    for name, fmt, page_count, dpi, noise, skew, text_layer in DOCUMENTS:
+        pages = [page_lines(rng, 40) for _ in range(page_count)]
+        if name.startswith("form_letter"):
+            lines = list(template)
+            if name == "form_letter_amount":
+                lines[AMOUNT_LINE] = lines[AMOUNT_LINE].replace("512.00", "587.00")
+            elif name == "form_letter_line":
+                lines[20] = f"Total amount due {rng.randint(1000, 9999)}.00 within 30 days."
+            pages = [lines]
+        if name == "blank_and_repeats":
+            # Cover sheet, blank back side, body, the cover sheet again, body, blank
+            pages = [pages[0], [], pages[2], pages[0], pages[4], []]
+        path = os.path.join(corpus_dir, f"{name}.{fmt}")
+        if text_layer:
+            write_text_layer_pdf(path, pages)
+        else:
+            # A page repeated within a document is the same scan, so the near-duplicate index can find it
+            rendered = {}
+            for lines in pages:
+                if id(lines) not in rendered:
+                    rendered[id(lines)] = render_page(lines, dpi, noise, skew, rng)
+            images = [rendered[id(lines)] for lines in pages]
+            if fmt == "pdf":
+                images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+            else:
+                images[0].save(path, quality=85) if fmt == "jpg" else images[0].save(path)
+        documents.append({
+            "path": os.path.basename(path),
+            "pages": page_count,
+            "dpi": dpi,
+            "noise": noise,
+            "skew": skew,
+            "text_layer": text_layer,
+            "truth": ["\n".join(lines) for lines in pages],
+        })
+    manifest = {"version": CORPUS_VERSION, "seed": seed, "documents": documents}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+class StubServer:
+    # The LLM stub on its own event loop thread, on a free local port
+    def __init__(self, latency):
+        self.stub = StubLLM(latency=latency)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        self.runner = web.AppRunner(self.stub.app())
+        asyncio.run_coroutine_threadsafe(self.runner.setup(), self.loop).result()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        asyncio.run_coroutine_threadsafe(site.start(), self.loop).result()
+        host, port = self.runner.addresses[0][:2]
+        self.api_base = f"http://{host}:{port}/v1"
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+def amount_line_variants(lines):
+    # The form letter with one character of its amount line changed: every digit to each other digit,
+    # every period to a comma and back. Each of these is another document and must not match.
+    line = lines[AMOUNT_LINE]
+    for i, char in enumerate(line):
+        if char.isdigit():
+            replacements = [digit for digit in "0123456789" if digit != char]
+        elif char in ".,":
+            replacements = ["," if char == "." else "."]
+        else:
+            continue
+        for replacement in replacements:
+            variant = list(lines)
+            variant[AMOUNT_LINE] = line[:i] + replacement + line[i + 1:]
+            yield f"{line[:i]}[{char}->{replacement}]{line[i + 1:]}", variant
+
+def check_dedupe(corpus_dir, manifest, seed=0, dpis=(150, 200), noise=8):
+    # Runs pages through a PageHashIndex with the default settings, without OCR: first the image
+    # documents of the corpus, then for each of dpis the form letter against every
+    # amount_line_variants() edit, all rendered with noise. Returns (reused, wrong, checked): how many
+    # corpus pages matched an earlier one, the pages that matched a page with other text, and how many
+    # edited pages were checked.
+    index = PageHashIndex()
+    reused, wrong = 0, []
+    for document in manifest["documents"]:
+        if document["path"].endswith(".pdf"):
+            continue
+        gray_img = cv2.imread(os.path.join(corpus_dir, document["path"]), cv2.IMREAD_GRAYSCALE)
+        signature = index.signature(gray_img)
+        match, _ = index.find(signature, "corpus")
+        if match is None:
+            index.add(signature, "corpus", document)
+            continue
+        reused += 1
+        if match["truth"] != document["truth"]:
+            wrong.append(f"{document['path']} matched {match['path']}")
+
+    letter = next(document for document in manifest["documents"] if document["path"] == "form_letter.png")
+    template = letter["truth"][0].split("\n")
+    rng = random.Random(seed)
+    checked = 0
+    for dpi in dpis:
+        index = PageHashIndex()
+        original = np.asarray(render_page(template, dpi, noise, 0.0, rng))
+        index.add(index.signature(original), "variants", "form_letter")
+        for edit, lines in amount_line_variants(template):
+            checked += 1
+            match, _ = index.find(index.signature(np.asarray(render_page(lines, dpi, noise, 0.0, rng))), "variants")
+            if match is not None:
+                wrong.append(f"form_letter at {dpi} DPI with {edit} matched the original")
+    return reused, wrong, checked
+
+STAGES = ("rasterize", "preprocess", "ocr", "page", "llm_request", "document")
+
+def run_benchmark(corpus_dir, latency=0.2, workers=None, documents_at_once=2, engine="auto",
+                  preprocess="grayscale", summarize=True, seed=0, dedupe_distance=DEFAULT_MAX_DISTANCE):
+    manifest = generate_corpus(corpus_dir, seed)
+    dedupe_reused, dedupe_wrong, dedupe_checked = check_dedupe(corpus_dir, manifest, seed)
+    metrics.METRICS.reset()
+    metrics.METRICS.enable(keep_samples=True)
+    rows = []
+    with StubServer(latency) as server:
+        # DocumentPipeline builds its client from OPENAI_API_BASE
+        previous_api_base = os.environ.get("OPENAI_API_BASE")
+        os.environ["OPENAI_API_BASE"] = server.api_base
+        try:
+            # Shared by all documents like in batch_cli.py --dedupe; None OCRs every page
+            page_index = PageHashIndex(dedupe_distance) if dedupe_distance is not None else None
+            with OCRPool(workers, engine=engine, preprocess=preprocess) as pool:
+                def process(document):
+                    pipeline = DocumentPipeline(
+                        os.path.join(corpus_dir, document["path"]),
+                        "stub",
+                        ocr_engine=engine,
+                        preprocess=preprocess,
+                        use_cache=False,
+                        summarize=summarize,
+                        pool=pool,
+                        page_index=page_index,
+                    )
+                    started = time.perf_counter()
+                    page_texts, _ = pipeline.run()
+                    return {
+                        "path": document["path"],
+                        "pages": len(page_texts),
+                        "seconds": time.perf_counter() - started,
+                        "accuracy": char_accuracy("\n".join(document["truth"]), "\n".join(page_texts)),
+                        "report": pipeline.report,
+                    }
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=documents_at_once) as executor:
+                    rows = list(executor.map(process, manifest["documents"]))
+                wall = time.perf_counter() - started
+                workers = pool.workers
+        finally:
+            if previous_api_base is None:
+                os.environ.pop("OPENAI_API_BASE", None)
+            else:
+                os.environ["OPENAI_API_BASE"] = previous_api_base
+        llm_requests = server.stub.requests
+
+    snapshot = metrics.METRICS.snapshot()
+    pages = sum(row["pages"] for row in rows)
+    result = {
+        "settings": {
+            "latency": latency,
+            "workers": workers,
+            "documents_at_once": documents_at_once,
+            "engine": engine,
+            "preprocess": preprocess,
+            "summarize": summarize,
+            "seed": seed,
+            "corpus_version": CORPUS_VERSION,
+            "dedupe_distance": dedupe_distance,
+        },
+        "pages": pages,
+        "seconds": wall,
+        "pages_per_second": pages / wall if wall else 0.0,
+        "accuracy": sum(row["accuracy"] for row in rows) / len(rows),
+        "stages": {
+            stage: {"p50": metrics.METRICS.percentile(stage, 50), "p95": metrics.METRICS.percentile(stage, 95)}
+            for stage in STAGES
+        },
+        "peak_rss_bytes": {
+            "main": snapshot["maxima"].get('peak_rss_bytes{process="main"}'),
+            "ocr_worker": snapshot["maxima"].get('peak_rss_bytes{process="ocr_worker"}'),
+        },
+        "llm_requests": llm_requests,
+        "dedupe": page_index.stats() if page_index is not None else None,
+        # Near-duplicate check on the image pages, independent of OCR
+        "dedupe_check": {"reused": dedupe_reused, "edited_pages": dedupe_checked, "wrong": dedupe_wrong},
+        "documents": rows,
+    }
+    metrics.METRICS.disable()
+    return result
+
+# Relative change that counts as a regression, per direction of "better"
+TOLERANCES = {"pages_per_second": 0.10, "accuracy": 0.01, "p95": 0.20, "peak_rss": 0.20}
+
+def compare(result, baseline):
+    # Returns (lines, regressions) describing result against baseline
+    lines, regressions = [], []
+
+    def check(label, current, previous, tolerance, higher_is_better):
+        if current is None or not previous:
+            return
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        line = f"{label}: {previous:.4g} -> {current:.4g} ({change:+.1%})"
+        if worse > tolerance:
+            line += "  REGRESSION"
+            regressions.append(label)
+        lines.append(line)
+
+    if result["settings"] != baseline.get("settings"):
+        lines.append(f"Warning: baseline settings differ: {baseline.get('settings')}")
+    check("pages/sec", result["pages_per_second"], baseline.get("pages_per_second"),
+          TOLERANCES["pages_per_second"], True)
+    # Accuracy is compared in absolute points
+    if baseline.get("accuracy") is not None:
+        drop = baseline["accuracy"] - result["accuracy"]
+        line = f"accuracy: {baseline['accuracy']:.4f} -> {result['accuracy']:.4f}"
+        if drop > TOLERANCES["accuracy"]:
+            line += "  REGRESSION"
+            regressions.append("accuracy")
+        lines.append(line)
+    for stage, values in result["stages"].items():
+        previous = baseline.get("stages", {}).get(stage, {})
+        check(f"{stage} p95", values["p95"], previous.get("p95"), TOLERANCES["p95"], False)
+    for process, value in result["peak_rss_bytes"].items():
+        check(f"peak RSS {process}", value, baseline.get("peak_rss_bytes", {}).get(process),
+              TOLERANCES["peak_rss"], False)
+    return lines, regressions
+
+def _ms(value):
+    return "-" if value is None else f"{value * 1000:.1f} ms"
+
+def print_result(result):
+    print(f"{result['pages']} pages in {result['seconds']:.2f} s: {result['pages_per_second']:.2f} pages/sec, "
+          f"mean character accuracy {result['accuracy']:.4f}, {result['llm_requests']} LLM requests")
+    for stage, values in result["stages"].items():
+        print(f"  {stage:<12} p50 {_ms(values['p50']):>10}  p95 {_ms(values['p95']):>10}")
+    for process, value in result["peak_rss_bytes"].items():
+        if value is not None:
+            print(f"  peak RSS {process}: {value / 1024 / 1024:.0f} MB")
+    dedupe = result["dedupe"]
+    if dedupe is not None:
+        print(f"  near-duplicate pages: {dedupe['hits']} of {dedupe['lookups']} reused earlier text "
+              f"({dedupe['hit_rate']:.1%}, {dedupe['rejected']} hash matches rejected on pixels)")
+    check = result["dedupe_check"]
+    print(f"  dedupe check: {check['reused']} image pages reused earlier text, {check['edited_pages']} edited "
+          f"form letters checked, {len(check['wrong'])} wrong matches")
+    for row in result["documents"]:
+        print(f"  {row['path']:<24} {row['pages']:>3} pages {row['seconds']:7.2f} s  accuracy {row['accuracy']:.4f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the OCR and summarization pipeline offline")
+    parser.add_argument("--corpus", default="bench_corpus", help="directory for the generated documents")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM latency in seconds")
+    parser.add_argument("--workers", type=int, default=default_worker_count(), help="OCR processes")
+    parser.add_argument("--documents-at-once", type=int, default=2)
+    parser.add_argument("--ocr-engine", default="auto")
+    parser.add_argument("--preprocess", default="grayscale", choices=sorted(PRESETS))
+    parser.add_argument("--no-summary", action="store_true", help="OCR only")
+    parser.add_argument("--dedupe-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                        help="max perceptual-hash distance for reusing an earlier page's text")
+    parser.add_argument("--no-dedupe", action="store_true", help="OCR every page, like batch_cli.py without --dedupe")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--output", default=None, help="also write the full result as JSON")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(
+        args.corpus, args.latency, args.workers, args.documents_at_once, args.ocr_engine, args.preprocess,
+        not args.no_summary, args.seed, None if args.no_dedupe else args.dedupe_distance,
+    )
+    print_result(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+    if result["dedupe_check"]["wrong"]:
+        # Another page's text handed out is a correctness bug, whatever the baseline says
+        for wrong in result["dedupe_check"]["wrong"]:
+            print(f"Near-duplicate reuse across different pages: {wrong}")
+        return 1
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    lines, regressions = compare(result, baseline)
+    print("Against baseline:")
+    for line in lines:
+        print(f"  {line}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
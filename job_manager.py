@@ -0,0 +1,150 @@
+import time
+from PyQt6.QtCore import QObject, QThreadPool, pyqtSignal
+from summary_worker import SummaryWorker
+from ocr_pool import OCRPool
+from utils import get_tesseract_path
+from llm_client import shared_rate_limiter
+
+# Higher runs first when documents wait for a free slot
+PRIORITIES = {"High": 2, "Normal": 1, "Low": 0}
+
+class DocumentJob:
+    def __init__(self, job_id, path, priority, worker, pool_key=None):
+        self.id = job_id
+        self.path = path
+        self.priority = priority
+        self.worker = worker
+        # Which of the manager's OCR pools the job runs on
+        self.pool_key = pool_key
+        self.state = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = None
+        self.page_texts = []
+        self.summary = ""
+        self.report = None
+        self.error = None
+        self.document_id = None
+
+    @property
+    def active(self):
+        return self.state in ("queued", "running", "cancelling")
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+class JobManager(QObject):
+    # Runs documents on its own thread pool; all jobs share OCR process pools so concurrent
+    # documents do not multiply the number of Tesseract processes.
+    job_added = pyqtSignal(object)
+    job_changed = pyqtSignal(object)
+
+    def __init__(self, max_jobs=2, parent=None):
+        super().__init__(parent)
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(max_jobs)
+        self.jobs = []
+        self.ocr_pools = {}
+        # Settings of the most recent submit; pools for older settings close once their jobs are done
+        self.ocr_pool_key = None
+        # Concurrent jobs share one LLM request/token budget instead of each getting the full rate
+        self.rate_limiter = shared_rate_limiter()
+
+    def set_max_jobs(self, max_jobs):
+        self.thread_pool.setMaxThreadCount(max_jobs)
+
+    def _ocr_pool_key(self, ocr_workers, ocr_engine, preprocess):
+        # Worker processes get the Tesseract executable when the pool starts, so it is part of the key
+        return (ocr_workers, ocr_engine, preprocess, get_tesseract_path())
+
+    def _ocr_pool(self, key):
+        self.ocr_pool_key = key
+        self._close_idle_pools()
+        if key not in self.ocr_pools:
+            ocr_workers, ocr_engine, preprocess, _ = key
+            self.ocr_pools[key] = OCRPool(ocr_workers, engine=ocr_engine, preprocess=preprocess)
+        return self.ocr_pools[key]
+
+    def _close_idle_pools(self):
+        in_use = {job.pool_key for job in self.jobs if job.active}
+        for key in list(self.ocr_pools):
+            if key != self.ocr_pool_key and key not in in_use:
+                self.ocr_pools.pop(key).shutdown()
+
+    def submit(self, path, api_key, organization, ocr_workers, ocr_engine, preprocess, refresh_summary=False,
+               priority="Normal", thumbnail=None):
+        pool_key = self._ocr_pool_key(ocr_workers, ocr_engine, preprocess)
+        worker = SummaryWorker(
+            path,
+            api_key,
+            organization,
+            ocr_workers,
+            ocr_engine,
+            preprocess,
+            refresh_summary=refresh_summary,
+            pool=self._ocr_pool(pool_key),
+            thumbnail=thumbnail,
+            rate_limiter=self.rate_limiter,
+        )
+        job = DocumentJob(len(self.jobs) + 1, path, priority, worker, pool_key)
+        # Worker signals arrive queued on the GUI thread, the job is bound at connect time
+        worker.job_started.connect(lambda job=job: self._started(job))
+        worker.page_ready.connect(lambda index, text, job=job: job.page_texts.append(text))
+        worker.progress.connect(lambda done, total, job=job: self._progress(job, done, total))
+        worker.summary_delta.connect(lambda fragment, job=job: self._summary_delta(job, fragment))
+        worker.document_saved.connect(lambda document_id, job=job: setattr(job, "document_id", document_id))
+        worker.report_ready.connect(lambda report, job=job: setattr(job, "report", report))
+        worker.summary_ready.connect(lambda text, summary, job=job: self._finished(job, "done", summary=summary))
+        worker.failed.connect(lambda error, job=job: self._finished(job, "failed", error=error))
+        worker.cancelled.connect(lambda job=job: self._finished(job, "cancelled"))
+        self.jobs.append(job)
+        self.job_added.emit(job)
+        self.thread_pool.start(worker.process_image_and_generate_summary, PRIORITIES[priority])
+        return job
+
+    def cancel(self, job):
+        if not job.active:
+            return
+        job.worker.cancel()
+        if job.state == "queued":
+            # It never started; the worker only reports back once the pool gets to it
+            self._finished(job, "cancelled")
+        else:
+            job.state = "cancelling"
+            self.job_changed.emit(job)
+
+    def _started(self, job):
+        if job.state == "queued":
+            job.state = "running"
+            job.started = time.time()
+            self.job_changed.emit(job)
+
+    def _progress(self, job, done, total):
+        job.progress = (done, total)
+        self.job_changed.emit(job)
+
+    def _summary_delta(self, job, fragment):
+        job.summary += fragment
+
+    def _finished(self, job, state, summary=None, error=None):
+        if not job.active:
+            return
+        job.state = state
+        job.finished = time.time()
+        if summary is not None:
+            job.summary = summary
+        job.error = error
+        self.job_changed.emit(job)
+        self._close_idle_pools()
+
+    def shutdown(self):
+        for job in self.jobs:
+            if job.active:
+                job.worker.cancel()
+        self.thread_pool.waitForDone()
+        for pool in self.ocr_pools.values():
+            pool.shutdown()
+        self.ocr_pools.clear()
@@ -0,0 +1,252 @@
+import asyncio
+import datetime
+import email.utils
+import importlib.util
+import json
+import math
+import os
+import random
+import threading
+import time
+from startup import LazyModule
+import metrics
+
+aiohttp = LazyModule("aiohttp")
+# None when it is not installed
+tiktoken = LazyModule("tiktoken") if importlib.util.find_spec("tiktoken") is not None else None
+
+OPENAI_API_BASE = "https://api.openai.com/v1"
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Without tiktoken, token counts are estimated on the high side. English prose runs about four
+# characters per token, but OCR text full of numbers and punctuation, or Spanish, about three; an
+# estimate of four would let a 3000 token chunk plus the answer overflow the 4097 token context.
+CHARS_PER_TOKEN = 2.5
+
+_encoding = None
+
+def count_tokens(text):
+    global _encoding
+    if tiktoken is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    if _encoding is None:
+        _encoding = tiktoken.encoding_for_model("text-davinci-003")
+    return len(_encoding.encode(text))
+
+def default_api_base():
+    return os.getenv("OPENAI_API_BASE", OPENAI_API_BASE)
+
+def parse_retry_after(value):
+    # Retry-After is either delay seconds or an HTTP date; None when missing or unreadable, in which
+    # case the normal backoff applies
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            # HTTP dates are always GMT
+            when = when.replace(tzinfo=datetime.timezone.utc)
+        seconds = when.timestamp() - time.time()
+    if not math.isfinite(seconds):
+        return None
+    return max(0.0, seconds)
+
+class LLMError(Exception):
+    pass
+
+class _RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+DEFAULT_REQUESTS_PER_MINUTE = 3000
+DEFAULT_TOKENS_PER_MINUTE = 250000
+
+class TokenBucket:
+    # Refills continuously at capacity per minute; callers wait until enough budget is available.
+    # Guarded by a thread lock rather than asyncio primitives, so pipelines running on different
+    # threads and event loops can draw on the same bucket.
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.available = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self, amount):
+        # Takes amount and returns 0, or returns how long to wait before there is enough
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.available >= amount:
+                self.available -= amount
+                return 0.0
+            return (amount - self.available) / self.rate
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            wait = self._take(amount)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+class RateLimiter:
+    # Request and token budgets of one API key
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens):
+        await self.request_bucket.acquire()
+        await self.token_bucket.acquire(tokens)
+
+_shared_limiters = {}
+_shared_limiters_lock = threading.Lock()
+
+def shared_rate_limiter(requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+    # One per process and set of limits. Every document gets its own client and event loop, so
+    # per-client buckets would let N documents in flight send N times the configured rate.
+    with _shared_limiters_lock:
+        key = (requests_per_minute, tokens_per_minute)
+        if key not in _shared_limiters:
+            _shared_limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _shared_limiters[key]
+
+class AsyncLLMClient:
+    def __init__(self, api_key, organization=None, api_base=None, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, max_connections=16, timeout=60, max_retries=6,
+                 backoff_base=0.5, backoff_max=30, rate_limiter=None):
+        self.api_key = api_key
+        self.organization = organization
+        self.api_base = (api_base or default_api_base()).rstrip("/")
+        # Shared with every other client in the process unless one is passed in
+        self.rate_limiter = rate_limiter or shared_rate_limiter(requests_per_minute, tokens_per_minute)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        # One pooled session carries every request of this client
+        if self.session is None:
+            headers = {"Authorization": f"Bearer {self.api_key}"}
+            if self.organization:
+                headers["OpenAI-Organization"] = self.organization
+            self.session = aiohttp.ClientSession(
+                headers=headers,
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _backoff(self, attempt, retry_after=None):
+        # Full jitter exponential backoff, never shorter than what the server asked for
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _count_tokens(self, prompt_tokens, text, usage=None):
+        if not metrics.enabled():
+            return
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens", prompt_tokens)
+        completion_tokens = usage.get("completion_tokens") if usage else None
+        metrics.inc("llm_tokens", prompt_tokens, kind="prompt")
+        metrics.inc("llm_tokens", completion_tokens if completion_tokens is not None else count_tokens(text),
+                    kind="completion")
+
+    async def _raise_for_status(self, response):
+        if response.status in RETRYABLE_STATUSES:
+            raise _RetryableError(
+                f"HTTP {response.status}: {await response.text()}",
+                parse_retry_after(response.headers.get("Retry-After")),
+            )
+        if response.status >= 400:
+            raise LLMError(f"HTTP {response.status}: {await response.text()}")
+
+    async def _post(self, path, payload):
+        async with self.session.post(
+            f"{self.api_base}{path}",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as response:
+            await self._raise_for_status(response)
+            return await response.json()
+
+    async def complete(self, prompt, model, **params):
+        await self.open()
+        payload = {"model": model, "prompt": prompt, **params}
+        prompt_tokens = count_tokens(prompt)
+        tokens = prompt_tokens + params.get("max_tokens", 16)
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire(tokens)
+            try:
+                with metrics.span("llm_request", stream=False):
+                    data = await self._post("/completions", payload)
+                text = data["choices"][0]["text"]
+                self._count_tokens(prompt_tokens, text, data.get("usage"))
+                return text.strip()
+            except (_RetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                metrics.inc("llm_retries", reason=type(e).__name__)
+                if attempt == self.max_retries:
+                    raise LLMError(f"Giving up after {attempt + 1} attempts: {e}") from e
+                await asyncio.sleep(self._backoff(attempt, getattr(e, "retry_after", None)))
+
+    async def stream_complete(self, prompt, model, **params):
+        # Yields text fragments as the server sends them; retries only until the first fragment arrives
+        await self.open()
+        payload = {"model": model, "prompt": prompt, "stream": True, **params}
+        prompt_tokens = count_tokens(prompt)
+        tokens = prompt_tokens + params.get("max_tokens", 16)
+        started = False
+        fragments = [] if metrics.enabled() else None
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire(tokens)
+            try:
+                with metrics.span("llm_request", stream=True):
+                    async with self.session.post(
+                        f"{self.api_base}/completions",
+                        json=payload,
+                        timeout=aiohttp.ClientTimeout(sock_connect=self.timeout, sock_read=self.timeout),
+                    ) as response:
+                        await self._raise_for_status(response)
+                        async for line in response.content:
+                            line = line.decode().strip()
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+                            started = True
+                            fragment = json.loads(data)["choices"][0]["text"]
+                            if fragments is not None:
+                                fragments.append(fragment)
+                            yield fragment
+                if fragments is not None:
+                    self._count_tokens(prompt_tokens, "".join(fragments))
+                return
+            except (_RetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                metrics.inc("llm_retries", reason=type(e).__name__)
+                if started or attempt == self.max_retries:
+                    raise LLMError(f"Giving up after {attempt + 1} attempts: {e}") from e
+                await asyncio.sleep(self._backoff(attempt, getattr(e, "retry_after", None)))
@@ -0,0 +1,93 @@
+"""
+    Local stand-in for the OpenAI completions endpoint, for testing and benchmarking without network access.
+    It answers POST /v1/completions after a configurable latency, answers 429 with Retry-After once the
+    requests-per-minute budget is spent, and can fail a share of requests with 500.
+
+    python llm_stub.py --port 8089 --latency 0.2 --rpm 60
+    OPENAI_API_BASE=http://127.0.0.1:8089/v1 python ocr_summarizer_app.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from aiohttp import web
+
+class StubLLM:
+    def __init__(self, latency=0.0, requests_per_minute=None, failure_rate=0.0):
+        self.latency = latency
+        self.requests_per_minute = requests_per_minute
+        self.failure_rate = failure_rate
+        self.recent = deque()
+        self.requests = 0
+        self.rejected = 0
+
+    def _rate_limited(self):
+        # Sliding one-minute window
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > 60:
+            self.recent.popleft()
+        if self.requests_per_minute is not None and len(self.recent) >= self.requests_per_minute:
+            return 60 - (now - self.recent[0])
+        self.recent.append(now)
+        return None
+
+    def answer(self, prompt):
+        words = prompt.split()
+        return " " + " ".join(words[:50])
+
+    async def completions(self, request):
+        self.requests += 1
+        retry_after = self._rate_limited()
+        if retry_after is not None:
+            self.rejected += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                status=429,
+                headers={"Retry-After": f"{retry_after:.3f}"},
+            )
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            return web.json_response({"error": {"message": "Stub failure", "type": "server_error"}}, status=500)
+        text = self.answer(payload.get("prompt", ""))
+        if payload.get("stream"):
+            return await self._stream(request, payload, text)
+        return web.json_response({
+            "object": "text_completion",
+            "model": payload.get("model"),
+            "choices": [{"text": text, "index": 0, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(payload.get("prompt", "")) // 4, "completion_tokens": len(text) // 4},
+        })
+
+    async def _stream(self, request, payload, text):
+        # Server-sent events, one word per event, like the real streaming API
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in text.split(" ")[1:]:
+            event = {"object": "text_completion", "model": payload.get("model"),
+                     "choices": [{"text": " " + word, "index": 0, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(event)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/completions", self.completions)
+        return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the OpenAI completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each answer")
+    parser.add_argument("--rpm", type=int, default=None, help="requests per minute before answering 429")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with 500")
+    args = parser.parse_args()
+    stub = StubLLM(args.latency, args.rpm, args.failure_rate)
+    web.run_app(stub.app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
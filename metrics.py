@@ -0,0 +1,247 @@
+"""
+    Optional instrumentation: stage spans (rasterize, preprocess, ocr, llm_request, persist, page,
+    document), counters (tokens, cache lookups, skipped pages) and peak memory. Disabled by default,
+    in which case span() hands back a shared no-op context manager and counters return immediately.
+
+    Export as JSON lines (one object per span/event) and as Prometheus text, either from a file
+    written on exit or from the service's GET /metrics. The GUI and CLIs enable it from the
+    environment:
+
+    OCRGPT_METRICS_LOG=metrics.jsonl OCRGPT_METRICS_FILE=metrics.prom python batch_cli.py scans/
+"""
+import contextlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is then left out
+    resource = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def peak_rss_bytes(children=False):
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(labels, **extra):
+    items = list(labels) + sorted(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in items) + "}"
+
+class _Span:
+    __slots__ = ("metrics", "name", "labels", "started")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self.labels
+        if exc_type is not None:
+            labels = {**labels, "error": exc_type.__name__}
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **labels)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.maxima = {}
+        # Raw span durations by name, only kept for benchmarks that need exact percentiles
+        self.samples = None
+        self.log_file = None
+        # Set in OCR pool workers: samples are shipped back to the parent with each result
+        self.pending = None
+
+    def enable(self, log_path=None, keep_samples=False):
+        with self.lock:
+            self.enabled = True
+            if keep_samples and self.samples is None:
+                self.samples = {}
+            if log_path and self.log_file is None:
+                self.log_file = open(log_path, "a", encoding="utf-8", buffering=1)
+
+    def disable(self):
+        with self.lock:
+            self.enabled = False
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.maxima.clear()
+            if self.samples is not None:
+                self.samples = {}
+
+    def _log(self, record):
+        if self.log_file is not None:
+            self.log_file.write(json.dumps({"ts": round(time.time(), 6), **record}, default=str) + "\n")
+
+    def span(self, name, **labels):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, labels)
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            if self.samples is not None:
+                self.samples.setdefault(name, []).append(seconds)
+            self._log({"type": "span", "span": name, "seconds": round(seconds, 6), **labels})
+            if self.pending is not None:
+                self.pending.append(("observe", name, seconds, labels))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if self.pending is not None:
+                self.pending.append(("inc", name, value, labels))
+
+    def set_max(self, name, value, **labels):
+        if not self.enabled or value is None:
+            return
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.maxima[key] = max(self.maxima.get(key, value), value)
+            if self.pending is not None:
+                self.pending.append(("set_max", name, value, labels))
+
+    def event(self, name, **fields):
+        # JSON log only, for per-document records that do not fit a metric
+        if not self.enabled:
+            return
+        with self.lock:
+            self._log({"type": "event", "event": name, **fields})
+
+    def collect(self):
+        # Pool worker side: record everything so drain() can hand it to the parent
+        self.enabled = True
+        self.pending = []
+
+    def drain(self):
+        with self.lock:
+            samples, self.pending = self.pending, []
+        return samples
+
+    def merge(self, samples):
+        for kind, name, value, labels in samples:
+            getattr(self, kind)(name, value, **labels)
+
+    def percentile(self, name, q):
+        # Nearest-rank percentile over the kept samples of a span, None when there are none
+        with self.lock:
+            values = sorted((self.samples or {}).get(name, ()))
+        if not values:
+            return None
+        return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+    def snapshot(self):
+        self.set_max("peak_rss_bytes", peak_rss_bytes(), process="main")
+        with self.lock:
+            return {
+                "stages": {
+                    f"{name}{_format_labels(labels)}": {"count": h[-1], "seconds": round(h[-2], 6)}
+                    for (name, labels), h in self.histograms.items()
+                },
+                "counters": {f"{name}{_format_labels(labels)}": v for (name, labels), v in self.counters.items()},
+                "maxima": {f"{name}{_format_labels(labels)}": v for (name, labels), v in self.maxima.items()},
+            }
+
+    def prometheus_text(self):
+        self.set_max("peak_rss_bytes", peak_rss_bytes(), process="main")
+        lines = [
+            "# HELP ocrgpt_stage_seconds Time spent per pipeline stage",
+            "# TYPE ocrgpt_stage_seconds histogram",
+        ]
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                for bound, count in zip(LATENCY_BUCKETS, histogram):
+                    lines.append(f"ocrgpt_stage_seconds_bucket{_format_labels(labels, stage=name, le=bound)} {count}")
+                lines.append(f"ocrgpt_stage_seconds_bucket{_format_labels(labels, stage=name, le='+Inf')} {histogram[-1]}")
+                lines.append(f"ocrgpt_stage_seconds_sum{_format_labels(labels, stage=name)} {histogram[-2]:.6f}")
+                lines.append(f"ocrgpt_stage_seconds_count{_format_labels(labels, stage=name)} {histogram[-1]}")
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE ocrgpt_{name}_total counter")
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f"ocrgpt_{name}_total{_format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.maxima}):
+                lines.append(f"# TYPE ocrgpt_{name} gauge")
+                for (gauge, labels), value in sorted(self.maxima.items()):
+                    if gauge == name:
+                        lines.append(f"ocrgpt_{name}{_format_labels(labels)} {value}")
+            lookups = {}
+            for (name, labels), value in self.counters.items():
+                if name == "cache_lookups":
+                    labels = dict(labels)
+                    table = lookups.setdefault(labels["table"], [0, 0])
+                    table[0 if labels["result"] == "hit" else 1] += value
+            if lookups:
+                lines.append("# TYPE ocrgpt_cache_hit_ratio gauge")
+                for table, (hits, misses) in sorted(lookups.items()):
+                    lines.append(f'ocrgpt_cache_hit_ratio{{table="{table}"}} {hits / (hits + misses):.6f}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Written next to the target and renamed, so a scraper never reads half a file
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+METRICS = Metrics()
+span = METRICS.span
+observe = METRICS.observe
+inc = METRICS.inc
+event = METRICS.event
+
+def enabled():
+    return METRICS.enabled
+
+def configure_from_env():
+    # OCRGPT_METRICS_LOG: JSON lines file; OCRGPT_METRICS_FILE: Prometheus text written by write_metrics_file()
+    log_path = os.getenv("OCRGPT_METRICS_LOG")
+    if log_path or os.getenv("OCRGPT_METRICS_FILE") or os.getenv("OCRGPT_METRICS"):
+        METRICS.enable(log_path)
+
+def write_metrics_file(path=None):
+    path = path or os.getenv("OCRGPT_METRICS_FILE")
+    if path and METRICS.enabled:
+        METRICS.write_prometheus(path)
@@ -0,0 +1,258 @@
+"""
+    OCR backends. Check that the installed pytesseract/tesserocr and Tesseract work together, both for
+    plain text and for the word confidences --adaptive-dpi uses:
+
+    python ocr_engines.py
+"""
+import argparse
+import importlib.util
+import os
+import queue
+import sys
+import tempfile
+from startup import LazyModule
+
+DEFAULT_TESSERACT_CMD = "tesseract"
+# Set from the GUI preferences or --tesseract-path, possibly before pytesseract is loaded
+_tesseract_cmd = None
+
+def _configure_pytesseract(module):
+    if _tesseract_cmd is not None:
+        module.pytesseract.tesseract_cmd = _tesseract_cmd
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+pytesseract = LazyModule("pytesseract", on_load=_configure_pytesseract)
+
+def set_tesseract_path(path):
+    global _tesseract_cmd
+    _tesseract_cmd = path
+    if "pytesseract" in sys.modules:
+        pytesseract.pytesseract.tesseract_cmd = path
+
+def get_tesseract_path():
+    if "pytesseract" in sys.modules:
+        return pytesseract.pytesseract.tesseract_cmd
+    return _tesseract_cmd or DEFAULT_TESSERACT_CMD
+
+def tesserocr_available():
+    # Checked without importing: loading tesserocr initializes OpenMP, which must happen
+    # only after a pool worker has set OMP_THREAD_LIMIT
+    return importlib.util.find_spec("tesserocr") is not None
+
+def _write_temp_image(gray_img, temp_dir):
+    # The tesseract CLI needs a file; PGM skips the PNG compress/decompress round-trip
+    fd, path = tempfile.mkstemp(suffix=".pgm", dir=temp_dir)
+    os.close(fd)
+    cv2.imwrite(path, gray_img)
+    return path
+
+def _read_text(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def mean_confidence(confidences):
+    # Tesseract reports -1 for layout entries that are not words
+    confidences = [float(c) for c in confidences if float(c) >= 0]
+    if not confidences:
+        return None
+    return sum(confidences) / len(confidences)
+
+def _tsv_confidences(tsv):
+    lines = tsv.splitlines()
+    if not lines:
+        return []
+    header = lines[0].split("\t")
+    conf_col, text_col = header.index("conf"), header.index("text")
+    confidences = []
+    for line in lines[1:]:
+        fields = line.split("\t")
+        if len(fields) > text_col and fields[text_col].strip():
+            confidences.append(fields[conf_col])
+    return confidences
+
+class OCREngine:
+    name = None
+
+    def __init__(self, lang="eng", psm=None, oem=None):
+        self.lang = lang
+        self.psm = psm
+        self.oem = oem
+
+    def version(self):
+        raise NotImplementedError
+
+    def config_key(self):
+        return f"{self.name}:{self.version()}:{self.lang}:{self.psm}:{self.oem}"
+
+    def recognize(self, gray_img, temp_dir):
+        raise NotImplementedError
+
+    def recognize_with_confidence(self, gray_img, temp_dir):
+        # Returns (text, mean word confidence 0-100); the confidence is None when no words were found
+        raise NotImplementedError
+
+    def warm_up(self):
+        pass
+
+    def close(self):
+        pass
+
+class PytesseractEngine(OCREngine):
+    # Fallback backend: one tesseract subprocess per page
+    name = "pytesseract"
+
+    def version(self):
+        return str(pytesseract.get_tesseract_version())
+
+    def _config(self):
+        options = []
+        if self.psm is not None:
+            options.append(f"--psm {self.psm}")
+        if self.oem is not None:
+            options.append(f"--oem {self.oem}")
+        return " ".join(options)
+
+    def recognize(self, gray_img, temp_dir):
+        image_file = _write_temp_image(gray_img, temp_dir)
+        try:
+            return pytesseract.image_to_string(image_file, lang=self.lang, config=self._config())
+        finally:
+            os.remove(image_file)
+
+    def recognize_with_confidence(self, gray_img, temp_dir):
+        # Text and TSV come out of the same tesseract run. run_tesseract has had this signature
+        # since the pinned 0.3.10; run_and_get_multiple_output is missing there and takes no config
+        # in later versions.
+        image_file = _write_temp_image(gray_img, temp_dir)
+        output_base = os.path.splitext(image_file)[0]
+        outputs = [f"{output_base}.txt", f"{output_base}.tsv"]
+        try:
+            pytesseract.pytesseract.run_tesseract(
+                image_file, output_base, "txt", self.lang, config=f"{self._config()} -c tessedit_create_tsv=1"
+            )
+            text, tsv = (_read_text(path) for path in outputs)
+        finally:
+            for path in [image_file] + outputs:
+                if os.path.exists(path):
+                    os.remove(path)
+        return text, mean_confidence(_tsv_confidences(tsv))
+
+class TesserocrEngine(OCREngine):
+    # Keeps initialized Tesseract API handles alive and reuses them page after page
+    name = "tesserocr"
+
+    def __init__(self, lang="eng", psm=None, oem=None):
+        super().__init__(lang, psm, oem)
+        self._handles = queue.LifoQueue()
+
+    def version(self):
+        import tesserocr
+        return tesserocr.tesseract_version().splitlines()[0]
+
+    def _create_handle(self):
+        import tesserocr
+        kwargs = {"lang": self.lang}
+        if self.psm is not None:
+            kwargs["psm"] = self.psm
+        if self.oem is not None:
+            kwargs["oem"] = self.oem
+        return tesserocr.PyTessBaseAPI(**kwargs)
+
+    def _acquire(self):
+        try:
+            return self._handles.get_nowait()
+        except queue.Empty:
+            return self._create_handle()
+
+    def recognize(self, gray_img, temp_dir):
+        return self._recognize(gray_img, False)[0]
+
+    def recognize_with_confidence(self, gray_img, temp_dir):
+        return self._recognize(gray_img, True)
+
+    def _recognize(self, gray_img, with_confidence):
+        gray_img = np.ascontiguousarray(gray_img)
+        height, width = gray_img.shape
+        api = self._acquire()
+        try:
+            api.SetImageBytes(gray_img.tobytes(), width, height, 1, width)
+            text = api.GetUTF8Text()
+            # Word confidences come from the recognition GetUTF8Text already ran
+            confidence = mean_confidence(api.AllWordConfidences()) if with_confidence else None
+            return text, confidence
+        finally:
+            api.Clear()
+            self._handles.put(api)
+
+    def warm_up(self):
+        if self._handles.empty():
+            self._handles.put(self._create_handle())
+
+    def close(self):
+        while not self._handles.empty():
+            self._handles.get_nowait().End()
+
+ENGINES = {
+    PytesseractEngine.name: PytesseractEngine,
+    TesserocrEngine.name: TesserocrEngine,
+}
+
+def available_engines():
+    names = [PytesseractEngine.name]
+    if tesserocr_available():
+        names.insert(0, TesserocrEngine.name)
+    return names
+
+_engines = {}
+
+def get_engine(name="auto", lang="eng", psm=None, oem=None):
+    # One engine per configuration and process, so its handles survive across pages
+    if name == "auto":
+        name = available_engines()[0]
+    if name not in ENGINES:
+        raise ValueError(f"Unknown OCR engine: {name}")
+    if name == TesserocrEngine.name and not tesserocr_available():
+        raise ValueError("The tesserocr engine requires the tesserocr package")
+    key = (name, lang, psm, oem)
+    if key not in _engines:
+        _engines[key] = ENGINES[name](lang, psm, oem)
+    return _engines[key]
+
+CHECK_TEXT = "Invoice 1582 due within 30 days."
+
+def check_engine(name, temp_dir=None):
+    # OCRs one rendered line both ways; returns (text, confidence) or raises
+    gray_img = np.full((80, 900), 255, np.uint8)
+    cv2.putText(gray_img, CHECK_TEXT, (10, 55), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 0, 2)
+    engine = get_engine(name)
+    text = engine.recognize(gray_img, temp_dir)
+    text_with_confidence, confidence = engine.recognize_with_confidence(gray_img, temp_dir)
+    if not text.strip() or text.strip() != text_with_confidence.strip():
+        raise RuntimeError(f"text differs between the two calls: {text!r} / {text_with_confidence!r}")
+    if confidence is None:
+        raise RuntimeError("no word confidences")
+    return text.strip(), confidence
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the installed OCR engines")
+    parser.add_argument("engines", nargs="*", default=None, help="engines to check, default all available")
+    parser.add_argument("--tesseract-path", default=None)
+    args = parser.parse_args(argv)
+    if args.tesseract_path:
+        set_tesseract_path(args.tesseract_path)
+
+    status = 0
+    for name in args.engines or available_engines():
+        try:
+            text, confidence = check_engine(name)
+        except Exception as e:
+            print(f"{name}: FAILED {type(e).__name__}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        version = f"pytesseract {pytesseract.__version__}, " if name == PytesseractEngine.name else ""
+        print(f"{name}: ok ({version}Tesseract {get_engine(name).version()}): {text!r}, confidence {confidence:.0f}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import json
+import os
+import time
+from functools import partial
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from utils import extract_text_from_image, extract_text_with_confidence, to_grayscale, set_tesseract_path, get_tesseract_path
+from ocr_engines import get_engine
+from result_cache import ocr_cache_key
+from preprocessing import get_preprocess_config, is_blank_page
+from startup import warm_up
+import metrics
+
+def default_worker_count():
+    return os.cpu_count() or 1
+
+def _init_worker(tesseract_cmd, omp_threads, engine, collect_metrics=False):
+    # Tesseract reads OMP_THREAD_LIMIT, so each process only gets its share of the cores
+    os.environ["OMP_THREAD_LIMIT"] = str(omp_threads)
+    set_tesseract_path(tesseract_cmd)
+    if collect_metrics:
+        metrics.METRICS.collect()
+    # Load the engine and image libraries up front so the first page does not wait for them; the
+    # engine's model then stays resident for every page this process handles
+    warm_up(("numpy", "cv2"))
+    get_engine(engine).warm_up()
+
+def _engine_config_key(engine):
+    return get_engine(engine).config_key()
+
+def _run_collecting(fn, item):
+    result = fn(item)
+    metrics.METRICS.set_max("peak_rss_bytes", metrics.peak_rss_bytes(), process="ocr_worker")
+    return result, metrics.METRICS.drain()
+
+def _completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+def ocr_config_key(engine_config_key, preprocess):
+    return f"{engine_config_key}|{get_preprocess_config(preprocess).key()}"
+
+def extract_text_cached(image, cache, temp_dir=None, engine="auto", preprocess="grayscale"):
+    gray_img = to_grayscale(image)
+    key = ocr_cache_key(gray_img, ocr_config_key(get_engine(engine).config_key(), preprocess))
+    text = cache.get(key)
+    if text is None:
+        text = extract_text_from_image(gray_img, temp_dir, engine, preprocess)
+        cache.put(key, text)
+    return text
+
+class OCRPool:
+    def __init__(self, workers=None, max_in_flight=None, engine="auto", preprocess="grayscale"):
+        self.engine = engine
+        self.preprocess = preprocess
+        self.workers = max(1, workers or default_worker_count())
+        self.omp_threads = max(1, default_worker_count() // self.workers)
+        self.max_in_flight = max_in_flight or self.workers * 2
+        # Decided once: worker processes only record spans when metrics were on when the pool started
+        self.collect_metrics = metrics.enabled()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(get_tesseract_path(), self.omp_threads, engine, self.collect_metrics),
+        )
+        self._config_key = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def config_key(self):
+        # Asked from a worker so the engine library is only ever loaded in the pool processes
+        if self._config_key is None:
+            engine_config_key = self.executor.submit(_engine_config_key, self.engine).result()
+            self._config_key = ocr_config_key(engine_config_key, self.preprocess)
+        return self._config_key
+
+    def submit(self, fn, item):
+        if not self.collect_metrics:
+            return self.executor.submit(fn, item)
+        # Worker spans ride back with the result and are merged exactly once, however many
+        # callers wait on the returned future
+        outer = Future()
+
+        def done(inner):
+            try:
+                result, samples = inner.result()
+            except BaseException as e:
+                outer.set_exception(e)
+                return
+            metrics.METRICS.merge(samples)
+            outer.set_result(result)
+
+        self.executor.submit(_run_collecting, fn, item).add_done_callback(done)
+        return outer
+
+    def _in_order(self, submissions):
+        # Bounded window of submitted pages, results are yielded in page order
+        pending = deque()
+        for future, tag in submissions:
+            pending.append((future, tag))
+            if len(pending) >= self.max_in_flight:
+                future, tag = pending.popleft()
+                yield future.result(), tag
+        while pending:
+            future, tag = pending.popleft()
+            yield future.result(), tag
+
+    def map(self, fn, items):
+        submissions = ((self.submit(fn, item), None) for item in items)
+        for result, _ in self._in_order(submissions):
+            yield result
+
+    def ocr_pages(self, pages, temp_dir=None, cache=None, blank_threshold=None, page_index=None):
+        for text, _ in self.ocr_pages_detailed(pages, temp_dir, cache, blank_threshold, page_index=page_index):
+            yield text
+
+    def ocr_pages_detailed(self, pages, temp_dir=None, cache=None, blank_threshold=None, with_confidence=False,
+                           page_index=None):
+        # Yields (text, info) per page in order. Blank pages, cache hits and near-duplicates of pages
+        # in page_index (a PageHashIndex) never reach the pool; info records why, so callers can
+        # report it. With with_confidence, info["confidence"] holds the mean word confidence and the
+        # cache stores it next to the text.
+        submissions = (
+            (future, (key, info))
+            for future, key, info in (
+                self.submit_page(page, temp_dir, cache, blank_threshold, with_confidence, page_index) for page in pages
+            )
+        )
+        for result, (key, info) in self._in_order(submissions):
+            yield self.finish_page(result, key, info, cache, with_confidence)
+
+    def submit_page(self, page, temp_dir=None, cache=None, blank_threshold=None, with_confidence=False,
+                    page_index=None):
+        # ocr_pages_detailed for one page, without waiting: returns (future, key, info). Pass the
+        # future's result to finish_page on this same thread, which writes the cache.
+        started = time.perf_counter()
+        gray_img = to_grayscale(page)
+        info = {"started": started}
+        if blank_threshold is not None:
+            blank, ratio = is_blank_page(gray_img, blank_threshold)
+            info.update(blank=blank, ink_ratio=ratio, blank_threshold=blank_threshold)
+            if blank:
+                return _completed(("", None) if with_confidence else ""), None, info
+        config_key = None
+        if cache is not None or page_index is not None:
+            config_key = self.config_key() + ("|confidence" if with_confidence else "")
+        key = None
+        if cache is not None:
+            key = ocr_cache_key(gray_img, config_key)
+            cached = cache.get(key)
+            if cached is not None:
+                info["cached"] = True
+                return _completed(json.loads(cached) if with_confidence else cached), None, info
+        if page_index is not None:
+            signature = page_index.signature(gray_img)
+            # The index holds futures, so a repeat of a page still being OCR'd waits for it
+            future, distance = page_index.find(signature, config_key)
+            if future is not None:
+                info.update(near_duplicate=True, hash_distance=distance)
+                return future, None, info
+        extract = extract_text_with_confidence if with_confidence else extract_text_from_image
+        future = self.submit(partial(extract, temp_dir=temp_dir, engine=self.engine, preprocess=self.preprocess), gray_img)
+        if page_index is not None:
+            page_index.add(signature, config_key, future)
+        return future, key, info
+
+    def finish_page(self, result, key, info, cache=None, with_confidence=False):
+        # Returns (text, info) for a result of submit_page
+        if key is not None:
+            cache.put(key, json.dumps(result) if with_confidence else result)
+        if with_confidence:
+            result, info["confidence"] = result
+        # Per-page latency: from the rendered page arriving here to its text being ready
+        started = info.pop("started")
+        if metrics.enabled():
+            outcome = next((name for name in ("blank", "cached", "near_duplicate") if info.get(name)), "ocr")
+            metrics.observe("page", time.perf_counter() - started, outcome=outcome)
+            metrics.inc("pages", outcome=outcome)
+        return result, info
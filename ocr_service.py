@@ -0,0 +1,340 @@
+"""
+    Local HTTP service for submitting images and PDFs programmatically.
+
+    POST /jobs                 multipart upload (field "file"), ?summarize=0 for text only -> 202 {"id", ...}
+    GET  /jobs/{id}            job status
+    GET  /jobs/{id}/result     text, summary and page report once the job is done
+    GET  /health               pool sizes and current load
+    GET  /metrics              Prometheus text (stage latencies, tokens, cache hit ratios), with --metrics
+
+    OCR jobs run on a bounded thread pool sharing one OCR process pool; summaries run on the event loop
+    with their own concurrency limit. When every slot and queue place is taken new uploads get 429.
+
+    python ocr_service.py --port 8088 --stub-llm
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from dotenv import load_dotenv
+from pipeline import DocumentPipeline, SUMMARY_CACHE_MAX_BYTES, SUMMARY_CACHE_TTL
+from pipeline import HIGH_DPI, LOW_DPI, MIN_CONFIDENCE
+from ocr_pool import OCRPool, default_worker_count
+from llm_client import AsyncLLMClient, default_api_base
+from llm_stub import StubLLM
+from result_cache import ResultCache
+from summarization import summarize_document_async
+from utils import SUPPORTED_EXTENSIONS, set_tesseract_path
+from preprocessing import BLANK_INK_RATIO, PRESETS
+from page_hash import DEFAULT_MAX_DISTANCE, PageHashIndex
+from startup import warm_up, warm_up_enabled
+import metrics
+
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+MAX_FINISHED_JOBS = 1000
+
+class Job:
+    def __init__(self, filename, path, summarize):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.path = path
+        self.summarize = summarize
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.page_texts = None
+        self.summary = None
+        self.report = None
+        self.error = None
+
+    @property
+    def active(self):
+        return self.status not in ("done", "failed")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "report": self.report,
+            "error": self.error,
+        }
+
+class OCRService:
+    def __init__(self, api_key=None, organization=None, api_base=None, ocr_workers=None, ocr_jobs=2,
+                 summary_jobs=4, max_queued=16, ocr_engine="auto", preprocess="grayscale", use_cache=True,
+                 blank_threshold=BLANK_INK_RATIO, adaptive_dpi=False, min_confidence=MIN_CONFIDENCE,
+                 dedupe_distance=None):
+        self.api_key = api_key
+        self.organization = organization
+        self.api_base = api_base
+        self.ocr_workers = ocr_workers
+        self.ocr_jobs = ocr_jobs
+        self.summary_jobs = summary_jobs
+        self.max_queued = max_queued
+        self.ocr_engine = ocr_engine
+        self.preprocess = preprocess
+        self.use_cache = use_cache
+        self.blank_threshold = blank_threshold
+        self.adaptive_dpi = adaptive_dpi
+        self.min_confidence = min_confidence
+        # Shared by all jobs; None (the default) OCRs every page
+        self.page_index = PageHashIndex(dedupe_distance) if dedupe_distance is not None else None
+        self.jobs = OrderedDict()
+        # Requests that passed the capacity check and are still uploading
+        self.uploading = 0
+        self.tasks = set()
+
+    @property
+    def capacity(self):
+        return self.ocr_jobs + self.summary_jobs + self.max_queued
+
+    def active_jobs(self):
+        return sum(1 for job in self.jobs.values() if job.active)
+
+    async def start(self, app):
+        self.upload_dir = tempfile.mkdtemp(prefix="ocrgpt_uploads_")
+        self.pool = OCRPool(self.ocr_workers, engine=self.ocr_engine, preprocess=self.preprocess)
+        self.ocr_executor = ThreadPoolExecutor(max_workers=self.ocr_jobs)
+        self.summary_semaphore = asyncio.Semaphore(self.summary_jobs)
+        self.client = AsyncLLMClient(self.api_key, self.organization, self.api_base)
+        await self.client.open()
+        self.summary_cache = None
+        if self.use_cache:
+            self.summary_cache = ResultCache(table="summary", max_bytes=SUMMARY_CACHE_MAX_BYTES, ttl=SUMMARY_CACHE_TTL)
+
+    async def stop(self, app):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.client.close()
+        self.ocr_executor.shutdown(wait=True, cancel_futures=True)
+        self.pool.shutdown()
+        if self.summary_cache is not None:
+            self.summary_cache.close()
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    async def _save_upload(self, request):
+        reader = await request.multipart()
+        async for field in reader:
+            if field.name != "file":
+                continue
+            filename = os.path.basename(field.filename or "upload")
+            if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                raise web.HTTPUnsupportedMediaType(text=f"Unsupported file type: {filename}")
+            # Keep the extension, the pipeline tells PDFs from images by it
+            fd, path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1], dir=self.upload_dir)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    # client_max_size does not apply to a streamed multipart body, so count here
+                    size = 0
+                    while True:
+                        chunk = await field.read_chunk()
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        if size > MAX_UPLOAD_BYTES:
+                            raise web.HTTPRequestEntityTooLarge(max_size=MAX_UPLOAD_BYTES, actual_size=size)
+                        f.write(chunk)
+            except BaseException:
+                os.remove(path)
+                raise
+            return filename, path
+        raise web.HTTPBadRequest(text='Expected a multipart upload with a "file" field')
+
+    async def submit(self, request):
+        # Uploads still being received count against capacity, or concurrent ones would all pass the check
+        if self.active_jobs() + self.uploading >= self.capacity:
+            return web.json_response(
+                {"error": "Service is at capacity, retry later"},
+                status=429,
+                headers={"Retry-After": "5"},
+            )
+        self.uploading += 1
+        try:
+            filename, path = await self._save_upload(request)
+        finally:
+            self.uploading -= 1
+        job = Job(filename, path, request.query.get("summarize", "1") != "0")
+        self.jobs[job.id] = job
+        self._forget_old_jobs()
+        task = asyncio.ensure_future(self._process(job))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.json_response(
+            {**job.to_dict(), "status_url": f"/jobs/{job.id}", "result_url": f"/jobs/{job.id}/result"},
+            status=202,
+        )
+
+    def _ocr(self, job):
+        # Runs on the OCR thread pool; summarization is left to the event loop
+        job.status = "ocr"
+        job.started = time.time()
+        pipeline = DocumentPipeline(
+            job.path,
+            None,
+            ocr_engine=self.ocr_engine,
+            preprocess=self.preprocess,
+            use_cache=self.use_cache,
+            summarize=False,
+            pool=self.pool,
+            blank_threshold=self.blank_threshold,
+            adaptive_dpi=self.adaptive_dpi,
+            min_confidence=self.min_confidence,
+            page_index=self.page_index,
+        )
+        page_texts, _ = pipeline.run()
+        return page_texts, pipeline.report
+
+    async def _process(self, job):
+        loop = asyncio.get_running_loop()
+        try:
+            job.page_texts, job.report = await loop.run_in_executor(self.ocr_executor, self._ocr, job)
+            if job.summarize:
+                job.status = "summary_queued"
+                async with self.summary_semaphore:
+                    job.status = "summarizing"
+                    job.summary = await summarize_document_async(self.client, job.page_texts, self.summary_cache)
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            job.finished = time.time()
+            if os.path.exists(job.path):
+                os.remove(job.path)
+
+    def _get_job(self, request):
+        job = self.jobs.get(request.match_info["job_id"])
+        if job is None:
+            raise web.HTTPNotFound(text="Unknown job")
+        return job
+
+    async def status(self, request):
+        return web.json_response(self._get_job(request).to_dict())
+
+    async def result(self, request):
+        job = self._get_job(request)
+        if job.status == "failed":
+            return web.json_response(job.to_dict(), status=500)
+        if job.status != "done":
+            return web.json_response(job.to_dict(), status=202)
+        return web.json_response({
+            **job.to_dict(),
+            "text": "\n".join(job.page_texts),
+            "pages": job.page_texts,
+            "summary": job.summary,
+        })
+
+    async def health(self, request):
+        return web.json_response({
+            "active_jobs": self.active_jobs(),
+            "uploading": self.uploading,
+            "capacity": self.capacity,
+            "ocr_jobs": self.ocr_jobs,
+            "ocr_workers": self.pool.workers,
+            "summary_jobs": self.summary_jobs,
+            "near_duplicates": self.page_index.stats() if self.page_index is not None else None,
+        })
+
+    async def prometheus_metrics(self, request):
+        if not metrics.enabled():
+            raise web.HTTPNotFound(text="Metrics are disabled, start the service with --metrics")
+        return web.Response(text=metrics.METRICS.prometheus_text(), content_type="text/plain",
+                            headers={"X-Prometheus-Format": "0.0.4"})
+
+    def app(self, stub=None):
+        app = web.Application(client_max_size=MAX_UPLOAD_BYTES)
+        app.router.add_post("/jobs", self.submit)
+        app.router.add_get("/jobs/{job_id}", self.status)
+        app.router.add_get("/jobs/{job_id}/result", self.result)
+        app.router.add_get("/health", self.health)
+        app.router.add_get("/metrics", self.prometheus_metrics)
+        if stub is not None:
+            app.router.add_post("/v1/completions", stub.completions)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Local OCR and summarization HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--ocr-workers", type=int, default=default_worker_count(), help="OCR processes")
+    parser.add_argument("--ocr-jobs", type=int, default=2, help="documents OCR'd at the same time")
+    parser.add_argument("--summary-jobs", type=int, default=4, help="documents summarized at the same time")
+    parser.add_argument("--max-queued", type=int, default=16, help="waiting jobs accepted before answering 429")
+    parser.add_argument("--ocr-engine", default="auto")
+    parser.add_argument("--preprocess", default="grayscale", choices=sorted(PRESETS))
+    parser.add_argument("--blank-threshold", type=float, default=BLANK_INK_RATIO,
+                        help="ink ratio below which a page is skipped as blank, 0 OCRs every page")
+    parser.add_argument("--adaptive-dpi", action="store_true",
+                        help=f"OCR PDF pages at {LOW_DPI} DPI and redo low-confidence pages at {HIGH_DPI} DPI")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE,
+                        help="mean word confidence (0-100) below which --adaptive-dpi redoes a page")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="reuse the OCR text of pages seen earlier, when hash and pixels both match")
+    parser.add_argument("--dedupe-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                        help="with --dedupe, max perceptual-hash distance (of 255 bits) checked against the pixels")
+    parser.add_argument("--metrics", action="store_true", help="record stage timings and serve GET /metrics")
+    parser.add_argument("--metrics-log", default=os.getenv("OCRGPT_METRICS_LOG"), help="JSON lines file of stage timings")
+    parser.add_argument("--tesseract-path", default=None)
+    parser.add_argument("--api-key", default=os.getenv("OPENAI_API_KEY"))
+    parser.add_argument("--organization", default=os.getenv("OPENAI_ORGANIZATION"))
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--stub-llm", action="store_true", help="answer summaries from a local stub instead of OpenAI")
+    parser.add_argument("--stub-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if not args.stub_llm and not args.api_key:
+        parser.error("an OpenAI API key is required (--api-key or OPENAI_API_KEY), or pass --stub-llm")
+    if args.tesseract_path:
+        set_tesseract_path(args.tesseract_path)
+    if args.metrics or args.metrics_log:
+        # Before the OCR pool starts, so its worker processes record their spans too
+        metrics.METRICS.enable(args.metrics_log)
+    stub = None
+    api_base = default_api_base()
+    if args.stub_llm:
+        # The stub is served by this same server
+        stub = StubLLM(latency=args.stub_latency)
+        api_base = f"http://{args.host}:{args.port}/v1"
+    service = OCRService(
+        args.api_key or "stub",
+        args.organization,
+        api_base,
+        args.ocr_workers,
+        args.ocr_jobs,
+        args.summary_jobs,
+        args.max_queued,
+        args.ocr_engine,
+        args.preprocess,
+        not args.no_cache,
+        args.blank_threshold or None,
+        args.adaptive_dpi,
+        args.min_confidence,
+        args.dedupe_distance if args.dedupe else None,
+    )
+    if warm_up_enabled():
+        # Before accepting jobs, so the first one does not wait for OpenCV and the OCR/PDF libraries
+        warm_up()
+    web.run_app(service.app(stub), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,38 @@ import sys
 import os
 import json
 import base64
-from PyQt6.QtCore import Qt, QByteArray, QBuffer, QIODevice, QSize, QThreadPool
-from PyQt6.QtGui import QImage, QPixmap
-from PyQt6.QtWidgets import QApplication, QLabel, QVBoxLayout, QWidget, QPushButton, QFileDialog, QTextEdit, QLineEdit, QScrollArea
+import sqlite3
+# First, so the startup time it records covers loading Qt and the rest of the app
+from startup import record_startup, warm_up_enabled, warm_up_in_background
+from PyQt6.QtCore import Qt, QThreadPool, QTimer
+from PyQt6.QtGui import QPixmap, QTextCursor
+from PyQt6.QtWidgets import QApplication, QLabel, QVBoxLayout, QWidget, QPushButton, QFileDialog, QTextEdit, QLineEdit, QScrollArea, QSpinBox, QComboBox, QCheckBox
+from PyQt6.QtWidgets import QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QListWidget, QListWidgetItem
 from dotenv import load_dotenv
-from utils import convert_pdf_to_images, set_tesseract_path, get_tesseract_path
-from summary_worker import SummaryWorker
+from utils import set_tesseract_path, get_tesseract_path
+from job_manager import JobManager, PRIORITIES
+from result_store import ResultStore
+import metrics
+from thumbnail_loader import ThumbnailLoader
+from ocr_pool import default_worker_count
+from ocr_engines import available_engines
+from preprocessing import PRESETS
 from custom_widgets import PasswordLineEdit, ImagePreview
-import openai
-import time
 
 load_dotenv()
 
+DEFAULT_MAX_JOBS = 2
+
 class OCRSummarizerApp(QWidget):
     def __init__(self):
         super().__init__()
+        self.job_manager = JobManager(DEFAULT_MAX_JOBS, self)
         self.init_ui()
+        self.job_manager.job_added.connect(self.add_job_row)
+        self.job_manager.job_changed.connect(self.update_job_row)
+        self.elapsed_timer = QTimer(self)
+        self.elapsed_timer.timeout.connect(self.update_elapsed)
+        self.elapsed_timer.start(1000)
         self.load_preferences()
     
     def load_preferences(self):
@@ -28,6 +44,10 @@ class OCRSummarizerApp(QWidget):
             self.api_key_edit.setText(base64.b64decode(preferences.get("api_key", "").encode()).decode())
             self.org_edit.setText(base64.b64decode(preferences.get("organization_id", "").encode()).decode())
             set_tesseract_path(preferences.get("tesseract_path", get_tesseract_path()))
+            self.ocr_workers_spin.setValue(preferences.get("ocr_workers", default_worker_count()))
+            self.ocr_engine_combo.setCurrentText(preferences.get("ocr_engine", "auto"))
+            self.preprocess_combo.setCurrentText(preferences.get("preprocess", "grayscale"))
+            self.max_jobs_spin.setValue(preferences.get("max_jobs", DEFAULT_MAX_JOBS))
 
     def save_preferences(self):
         preferences_path = os.path.join(os.path.expanduser("~"), "Documents", "openai_ocr", "preferences.json")
@@ -36,6 +56,10 @@ class OCRSummarizerApp(QWidget):
             "api_key":  base64.b64encode(self.api_key_edit.text().strip().encode()).decode(),
             "organization_id": base64.b64encode(self.org_edit.text().strip().encode()).decode(),
             "tesseract_path": get_tesseract_path(),
+            "ocr_workers": self.ocr_workers_spin.value(),
+            "ocr_engine": self.ocr_engine_combo.currentText(),
+            "preprocess": self.preprocess_combo.currentText(),
+            "max_jobs": self.max_jobs_spin.value(),
         }
         with open(preferences_path, "w") as f:
             json.dump(preferences, f)
@@ -68,6 +92,37 @@ class OCRSummarizerApp(QWidget):
         self.tesseract_button.clicked.connect(self.browse_tesseract)
         layout.addWidget(self.tesseract_button)
 
+        self.ocr_workers_label = QLabel("OCR Worker Processes:")
+        layout.addWidget(self.ocr_workers_label)
+
+        self.ocr_workers_spin = QSpinBox()
+        self.ocr_workers_spin.setRange(1, max(64, default_worker_count()))
+        self.ocr_workers_spin.setValue(default_worker_count())
+        layout.addWidget(self.ocr_workers_spin)
+
+        self.ocr_engine_label = QLabel("OCR Engine:")
+        layout.addWidget(self.ocr_engine_label)
+
+        self.ocr_engine_combo = QComboBox()
+        self.ocr_engine_combo.addItems(["auto"] + available_engines())
+        layout.addWidget(self.ocr_engine_combo)
+
+        self.preprocess_label = QLabel("Page Preprocessing:")
+        layout.addWidget(self.preprocess_label)
+
+        self.preprocess_combo = QComboBox()
+        self.preprocess_combo.addItems(list(PRESETS))
+        layout.addWidget(self.preprocess_combo)
+
+        self.max_jobs_label = QLabel("Documents Processed at Once:")
+        layout.addWidget(self.max_jobs_label)
+
+        self.max_jobs_spin = QSpinBox()
+        self.max_jobs_spin.setRange(1, 16)
+        self.max_jobs_spin.setValue(DEFAULT_MAX_JOBS)
+        self.max_jobs_spin.valueChanged.connect(self.job_manager.set_max_jobs)
+        layout.addWidget(self.max_jobs_spin)
+
         self.image_scroll_area = QScrollArea()
         self.image_label = ImagePreview()
         self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -75,6 +130,9 @@ class OCRSummarizerApp(QWidget):
         self.image_scroll_area.setWidgetResizable(True)
         layout.addWidget(self.image_scroll_area)
 
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
         self.text_scroll_area = QScrollArea()
         self.text_edit = QTextEdit()
         self.text_scroll_area.setWidget(self.text_edit)
@@ -85,10 +143,46 @@ class OCRSummarizerApp(QWidget):
         self.load_image_button.clicked.connect(self.load_image)
         layout.addWidget(self.load_image_button)
 
+        self.refresh_summary_check = QCheckBox("Fresh summary (ignore cached answer)")
+        layout.addWidget(self.refresh_summary_check)
+
+        self.priority_label = QLabel("Priority:")
+        layout.addWidget(self.priority_label)
+
+        self.priority_combo = QComboBox()
+        self.priority_combo.addItems(list(PRIORITIES))
+        self.priority_combo.setCurrentText("Normal")
+        layout.addWidget(self.priority_combo)
+
         self.summarize_button = QPushButton("Summarize")
         self.summarize_button.clicked.connect(self.summarize)
         layout.addWidget(self.summarize_button)
 
+        self.jobs_table = QTableWidget(0, 4)
+        self.jobs_table.setHorizontalHeaderLabels(["Document", "Priority", "State", "Elapsed"])
+        self.jobs_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        self.jobs_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.jobs_table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.jobs_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.jobs_table.itemSelectionChanged.connect(self.show_job)
+        layout.addWidget(self.jobs_table)
+
+        self.cancel_job_button = QPushButton("Cancel Selected Job")
+        self.cancel_job_button.clicked.connect(self.cancel_job)
+        layout.addWidget(self.cancel_job_button)
+
+        self.search_label = QLabel("Search Past Documents:")
+        layout.addWidget(self.search_label)
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText('e.g. invoice AND "due date"')
+        self.search_edit.returnPressed.connect(self.search_results)
+        layout.addWidget(self.search_edit)
+
+        self.search_list = QListWidget()
+        self.search_list.itemActivated.connect(self.show_stored_document)
+        layout.addWidget(self.search_list)
+
         self.setLayout(layout)
         
     def browse_tesseract(self):
@@ -110,40 +204,37 @@ class OCRSummarizerApp(QWidget):
         file_name, _ = QFileDialog.getOpenFileName(self, "Open Image/PDF", "", "Images/PDF (*.png *.xpm *.jpg *.bmp *.pdf);;All Files (*)", options=options)
 
         if file_name:
-            if file_name.lower().endswith(".pdf"):
-                images = convert_pdf_to_images(file_name)
-                if images:
-                    byte_array = QByteArray()
-                    buffer = QBuffer(byte_array)
-                    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
-                    images[0].save(buffer, "PNG")
-                    pixmap = QPixmap()
-                    pixmap.loadFromData(byte_array, "PNG")
-                    self.image_pages = images
-                else:
-                    self.image_pages = []
-            else:
-                pixmap = QPixmap(file_name)
-                self.image_pages = [pixmap]
-
-            if self.image_pages:
-                # Create a thumbnail
-                thumbnail_size = QSize(400, 400)
-                thumbnail_image = self.image_pages[0].toqimage().scaled(thumbnail_size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                thumbnail_pixmap = QPixmap.fromImage(thumbnail_image)
-
-                # Save the thumbnail to the openai_ocr folder with a timestamp ID
-                self.timestamp = str(int(time.time()))
-                thumbnail_filename = f"thumbnail_{self.timestamp}.png"
-                thumbnail_folder = os.path.join(os.path.expanduser("~"), "Documents", "openai_ocr")
-                os.makedirs(thumbnail_folder, exist_ok=True)
-                thumbnail_filepath = os.path.join(thumbnail_folder, thumbnail_filename)
-                thumbnail_pixmap.save(thumbnail_filepath)
-                                    
-                # Display the thumbnail
-                self.image_label.setPixmap(thumbnail_pixmap)
-                self.image_path = file_name
-                         
+            # Rendering happens on the thread pool; OCR later streams the pages it needs from the file
+            self.loading_path = file_name
+            self.image_label.clear()
+            self.image_label.setText("Loading preview...")
+            self.status_label.setText(f"Loading {os.path.basename(file_name)}...")
+            self.summarize_button.setEnabled(False)
+            self.loader = ThumbnailLoader(file_name)
+            self.loader.thumbnail_ready.connect(self.display_thumbnail)
+            self.loader.failed.connect(self.display_load_error)
+            QThreadPool.globalInstance().start(self.loader.load)
+
+    def display_thumbnail(self, path, thumbnail, png):
+        # A file picked while this one was loading wins
+        if path != self.loading_path:
+            return
+        self.image_label.setPixmap(QPixmap.fromImage(thumbnail))
+        self.image_path = path
+        self.thumbnail_png = png
+        self.status_label.setText(f"Loaded {os.path.basename(path)}")
+        self.summarize_button.setEnabled(True)
+
+    def display_load_error(self, path, error):
+        if path != self.loading_path:
+            return
+        # The file is still summarized without a preview; if it cannot be read at all, OCR reports why
+        self.image_label.setText("No preview")
+        self.image_path = path
+        self.thumbnail_png = None
+        self.status_label.setText(f"Could not load {os.path.basename(path)}: {error}")
+        self.summarize_button.setEnabled(True)
+
     def summarize(self):
         api_key = self.api_key_edit.text().strip()
         if not api_key:
@@ -155,45 +246,163 @@ class OCRSummarizerApp(QWidget):
             self.text_edit.setPlainText("Please enter a valid OpenAI organization.")
             return
 
-
-        openai.api_key = api_key
-        openai.organization = org
-
         if hasattr(self, "image_path"):
-            # Wrap the existing summary generation process in a separate function
-            self.worker = SummaryWorker(self.image_path, self.image_pages)
-            self.worker.summary_ready.connect(self.display_summary)
-            QThreadPool.globalInstance().start(self.worker.process_image_and_generate_summary)
+            job = self.job_manager.submit(
+                self.image_path,
+                api_key,
+                org,
+                self.ocr_workers_spin.value(),
+                self.ocr_engine_combo.currentText(),
+                self.preprocess_combo.currentText(),
+                self.refresh_summary_check.isChecked(),
+                self.priority_combo.currentText(),
+                getattr(self, "thumbnail_png", None),
+            )
+            # Each handler gets its own job, so several documents can run without mixing up results
+            job.worker.page_ready.connect(lambda index, text, job=job: self.display_page(job, index, text))
+            job.worker.summary_delta.connect(lambda fragment, job=job: self.display_summary_delta(job, fragment))
+            job.worker.summary_ready.connect(lambda text, summary, job=job: self.display_summary(job, text, summary))
+            self.jobs_table.selectRow(job.id - 1)
         else:
             self.text_edit.setPlainText("Please load an image or PDF first.")
-    
-    def display_summary(self, text, summary):  # Add 'text' as an argument
-        self.text_edit.setPlainText(summary)
-        
-        # Save OCR text to the openai_ocr folder with a timestamp ID
-        ocr_filename = f"ocr_text_{self.worker.timestamp}.txt"
-        ocr_folder = os.path.join(os.path.expanduser("~"), "Documents", "openai_ocr")
-        os.makedirs(ocr_folder, exist_ok=True)
-        ocr_filepath = os.path.join(ocr_folder, ocr_filename)
-        with open(ocr_filepath, "w") as f:
-            f.write(text)
-
-        # Save OpenAI response to the openai_ocr folder with a timestamp ID
-        openai_filename = f"openai_response_{self.worker.timestamp}.txt"
-        openai_folder  = os.path.join(os.path.expanduser("~"), "Documents", "openai_ocr")
-        os.makedirs(openai_folder , exist_ok=True)
-        openai_filepath  = os.path.join(openai_folder , openai_filename)
-        with open(openai_filepath , "w") as f:
-            f.write(summary)
-    
+
+    def selected_job(self):
+        rows = self.jobs_table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.job_manager.jobs[rows[0].row()]
+
+    def add_job_row(self, job):
+        row = self.jobs_table.rowCount()
+        self.jobs_table.insertRow(row)
+        for column, value in enumerate((os.path.basename(job.path), job.priority, "", "")):
+            self.jobs_table.setItem(row, column, QTableWidgetItem(value))
+        self.update_job_row(job)
+
+    def update_job_row(self, job):
+        state = job.state
+        if job.state == "running" and job.progress is not None:
+            state = f"running, page {job.progress[0]} of {job.progress[1]}"
+        elif job.state == "failed":
+            state = f"failed: {job.error}"
+        self.jobs_table.item(job.id - 1, 2).setText(state)
+        self.jobs_table.item(job.id - 1, 3).setText(f"{job.elapsed():.0f} s")
+        if job is self.selected_job():
+            self.status_label.setText(self.job_status(job))
+
+    def update_elapsed(self):
+        for job in self.job_manager.jobs:
+            if job.state in ("running", "cancelling"):
+                self.jobs_table.item(job.id - 1, 3).setText(f"{job.elapsed():.0f} s")
+
+    def job_status(self, job):
+        report = job.report
+        if job.state == "done" and report:
+            return (
+                f"Done: {report['pages']} pages, {report['text_layer_pages']} from the PDF text layer, "
+                f"{report['ocr_pages']} OCR'd, {len(report['blank_pages'])} blank skipped"
+            )
+        if job.state == "running" and job.summary:
+            return "Summarizing..."
+        if job.state == "running" and job.progress is not None:
+            return f"OCR: page {job.progress[0]} of {job.progress[1]}"
+        if job.state == "failed":
+            return f"Failed: {job.error}"
+        return job.state.capitalize()
+
+    def show_job(self):
+        # The text view follows the selected job: its summary once there is one, OCR text before
+        job = self.selected_job()
+        if job is None:
+            return
+        if job.summary:
+            self.text_edit.setPlainText(job.summary)
+        else:
+            self.text_edit.setPlainText(
+                "\n".join(f"--- Page {i + 1} ---\n{text}\n" for i, text in enumerate(job.page_texts))
+            )
+        self.status_label.setText(self.job_status(job))
+
+    def cancel_job(self):
+        job = self.selected_job()
+        if job is not None:
+            self.job_manager.cancel(job)
+
+    def display_page(self, job, index, text):
+        # OCR text fills the view page by page until the summary starts arriving
+        if job is self.selected_job() and not job.summary:
+            self.text_edit.append(f"--- Page {index + 1} ---\n{text}\n")
+
+    def display_summary_delta(self, job, fragment):
+        if job is not self.selected_job():
+            return
+        if job.summary == fragment:
+            # First fragment: the job manager has already recorded it
+            self.text_edit.clear()
+            self.status_label.setText("Summarizing...")
+        self.text_edit.moveCursor(QTextCursor.MoveOperation.End)
+        self.text_edit.insertPlainText(fragment)
+
+    def display_summary(self, job, text, summary):  # Add 'text' as an argument
+        # The worker has already saved text, summary and thumbnail to the result store
+        if job is self.selected_job():
+            self.text_edit.setPlainText(summary)
+            self.status_label.setText(self.job_status(job))
+
+    def search_results(self):
+        query = self.search_edit.text().strip()
+        self.search_list.clear()
+        if not query:
+            return
+        # FTS lookups take milliseconds, so the GUI thread can run them directly
+        try:
+            with ResultStore() as store:
+                hits = store.search(query)
+        except sqlite3.OperationalError as e:
+            self.status_label.setText(f"Invalid search: {e}")
+            return
+        for hit in hits:
+            where = f"page {hit['page_number']}" if hit["page_number"] is not None else "summary"
+            item = QListWidgetItem(f"{hit['name']} ({where}): {hit['snippet']}")
+            item.setData(Qt.ItemDataRole.UserRole, hit["document_id"])
+            self.search_list.addItem(item)
+        self.status_label.setText(f"{len(hits)} matches" if hits else "No matches")
+
+    def show_stored_document(self, item):
+        with ResultStore() as store:
+            document_id = item.data(Qt.ItemDataRole.UserRole)
+            document = store.get_document(document_id)
+            thumbnail = store.thumbnail(document_id)
+        if document is None:
+            return
+        self.jobs_table.clearSelection()
+        pages = "\n".join(f"--- Page {i + 1} ---\n{text}\n" for i, text in enumerate(document["pages"]))
+        self.text_edit.setPlainText(f"{document['summary'] or ''}\n\n{pages}".strip())
+        if thumbnail:
+            pixmap = QPixmap()
+            pixmap.loadFromData(thumbnail, "PNG")
+            self.image_label.setPixmap(pixmap)
+        self.status_label.setText(f"Stored result for {document['path']}")
+
     def closeEvent(self, event):
         self.save_preferences()
+        self.job_manager.shutdown()
+        metrics.write_metrics_file()
         super().closeEvent(event)
 
 def main():
+    metrics.configure_from_env()
     app = QApplication(sys.argv)
     window = OCRSummarizerApp()
     window.show()
+
+    def window_shown():
+        # OCR, PDF and LLM libraries load on first use; warm them up now that the window is up
+        record_startup("window_shown")
+        if warm_up_enabled():
+            warm_up_in_background()
+
+    QTimer.singleShot(0, window_shown)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+import threading
+from startup import LazyModule
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+HASH_SIZE = 16
+# Out of 255 bits. Re-scans and repeated copies of a page typically land within ~10, unrelated pages
+# of the same layout 80 or more apart. The hash alone cannot tell pages of one template apart:
+# changing a number at the end of a line measures 0-6 and replacing a whole line about 12, so
+# every hash match is checked against the pixels before its text is reused.
+DEFAULT_MAX_DISTANCE = 12
+# Each entry keeps a VERIFY_WIDTH px copy of its page, about 0.9 MB for a letter page
+DEFAULT_CAPACITY = 100
+# Pixel check: both pages are scaled to VERIFY_WIDTH and compared in VERIFY_BLOCK px blocks. At 850 px
+# an 11pt glyph spans several blocks: one changed digit or a period turned comma moves the worst block
+# by 50 or more gray levels, a re-scan with noise 8 by under 14. Heavier noise can exceed the limit;
+# such a page is simply OCR'd again.
+VERIFY_WIDTH = 850
+VERIFY_BLOCK = 2
+VERIFY_MAX_DIFF = 24
+
+def perceptual_hash(gray_img, hash_size=HASH_SIZE):
+    # pHash: low DCT frequencies of a small copy, compared to their median. Noise, slight skew and
+    # shifts from rescanning mostly change high frequencies, which are dropped.
+    small = cv2.resize(gray_img, (4 * hash_size, 4 * hash_size), interpolation=cv2.INTER_AREA)
+    coefficients = cv2.dct(small.astype(np.float32))[:hash_size, :hash_size].ravel()[1:]
+    return np.packbits(coefficients > np.median(coefficients))
+
+def hamming_distance(hash_a, hash_b):
+    return int(np.unpackbits(hash_a ^ hash_b).sum())
+
+def verification_image(gray_img, width=VERIFY_WIDTH):
+    height = max(1, round(gray_img.shape[0] * width / gray_img.shape[1]))
+    return cv2.resize(gray_img, (width, height), interpolation=cv2.INTER_AREA)
+
+def same_pixels(image_a, image_b, block=VERIFY_BLOCK, max_diff=VERIFY_MAX_DIFF):
+    # Worst mean absolute difference over block x block tiles of two verification images. A whole-page
+    # mean would hide a changed amount; a per-pixel maximum would fail on noise.
+    if image_a.shape != image_b.shape:
+        return False
+    diff = cv2.absdiff(image_a, image_b)
+    height, width = (diff.shape[0] // block) * block, (diff.shape[1] // block) * block
+    tiles = diff[:height, :width].reshape(height // block, block, width // block, block)
+    return float(tiles.mean(axis=(1, 3)).max()) <= max_diff
+
+class PageHashIndex:
+    # Ring buffer of the most recently seen page hashes, a small copy of each page and what was
+    # computed for them. Entries are namespaced (by OCR configuration) so text is only reused for
+    # pages OCR'd the same way, and a hash match only counts once the pixels agree too.
+    # Shared between documents and threads.
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, capacity=DEFAULT_CAPACITY, hash_size=HASH_SIZE):
+        self.max_distance = max_distance
+        self.capacity = capacity
+        self.hash_size = hash_size
+        self.hashes = np.zeros((capacity, (hash_size * hash_size - 1 + 7) // 8), dtype=np.uint8)
+        self.namespaces = np.full(capacity, -1, dtype=np.int64)
+        self.values = [None] * capacity
+        self.images = [None] * capacity
+        self.namespace_ids = {}
+        self.next = 0
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.rejected = 0
+
+    def signature(self, gray_img):
+        # (hash, verification image) of a page, for find() and add()
+        return perceptual_hash(gray_img, self.hash_size), verification_image(gray_img)
+
+    def find(self, signature, namespace):
+        # Returns (value, distance) of the closest entry within max_distance whose pixels match too,
+        # or (None, None)
+        page_hash, image = signature
+        with self.lock:
+            self.lookups += 1
+            namespace_id = self.namespace_ids.get(namespace)
+            if namespace_id is None:
+                return None, None
+            candidates = np.nonzero(self.namespaces == namespace_id)[0]
+            if len(candidates) == 0:
+                return None, None
+            distances = np.unpackbits(self.hashes[candidates] ^ page_hash, axis=1).sum(axis=1)
+            close = np.argsort(distances, kind="stable")
+            close = close[distances[close] <= self.max_distance]
+            for best in close:
+                slot = candidates[best]
+                if same_pixels(self.images[slot], image):
+                    self.hits += 1
+                    return self.values[slot], int(distances[best])
+            if len(close):
+                self.rejected += 1
+            return None, None
+
+    def add(self, signature, namespace, value):
+        page_hash, image = signature
+        with self.lock:
+            slot = self.next
+            self.next = (self.next + 1) % self.capacity
+            self.hashes[slot] = page_hash
+            self.images[slot] = image
+            self.namespaces[slot] = self.namespace_ids.setdefault(namespace, len(self.namespace_ids))
+            self.values[slot] = value
+
+    def stats(self):
+        with self.lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                # Hash matches whose pixels differed, e.g. the same form with another amount
+                "rejected": self.rejected,
+                "max_distance": self.max_distance,
+            }
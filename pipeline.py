@@ -0,0 +1,253 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from utils import extract_text_from_image, get_pdf_page_count, iter_pdf_page_numbers, job_temp_dir
+from utils import extract_pdf_text_layer, has_usable_text, to_grayscale
+from ocr_pool import OCRPool, extract_text_cached
+from result_cache import ResultCache
+from llm_client import AsyncLLMClient
+from summarization import summarize_stream
+from preprocessing import BLANK_INK_RATIO, is_blank_page
+import metrics
+
+SUMMARY_CACHE_TTL = 30 * 24 * 3600
+SUMMARY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Two-pass mode: everything is OCR'd at LOW_DPI first, pages under MIN_CONFIDENCE again at HIGH_DPI
+DEFAULT_DPI = 200
+LOW_DPI = 150
+HIGH_DPI = 300
+MIN_CONFIDENCE = 80
+
+class PipelineCancelled(Exception):
+    pass
+
+class DocumentPipeline:
+    # OCR runs on a helper thread and feeds pages into an asyncio queue; summarization of the
+    # first chunks starts while later pages are still being OCR'd. Callbacks fire on the thread
+    # that called run().
+    def __init__(self, path, api_key, organization=None, ocr_workers=None, ocr_engine="auto", preprocess="grayscale",
+                 use_cache=True, refresh_summary=False, on_page=None, on_progress=None, on_summary_delta=None,
+                 summarize=True, pool=None, blank_threshold=BLANK_INK_RATIO, adaptive_dpi=False,
+                 min_confidence=MIN_CONFIDENCE, page_index=None, rate_limiter=None):
+        self.path = path
+        self.api_key = api_key
+        self.organization = organization
+        self.ocr_workers = ocr_workers
+        self.ocr_engine = ocr_engine
+        self.preprocess = preprocess
+        self.use_cache = use_cache
+        self.refresh_summary = refresh_summary
+        self.on_page = on_page
+        self.on_progress = on_progress
+        self.on_summary_delta = on_summary_delta
+        self.summarize = summarize
+        # A shared OCRPool lets several documents use the same worker processes
+        self.pool = pool
+        # Pages with less ink than this are skipped without OCR, None OCRs every page
+        self.blank_threshold = blank_threshold
+        self.adaptive_dpi = adaptive_dpi
+        self.min_confidence = min_confidence
+        # A PageHashIndex shared across documents: near-duplicates of pages seen before reuse their text
+        self.page_index = page_index
+        # LLM request/token budget; None uses the process-wide one, shared by all documents in flight
+        self.rate_limiter = rate_limiter
+        self.page_count = None
+        self.page_texts = []
+        # blank_ink_ratios lines up with blank_pages, so every skip can be checked against the threshold
+        self.report = {"pages": 0, "text_layer_pages": 0, "ocr_pages": 0, "blank_pages": [], "blank_ink_ratios": [],
+                       "blank_threshold": blank_threshold, "near_duplicate_pages": []}
+        if adaptive_dpi:
+            self.report.update(dpi=LOW_DPI, high_dpi=HIGH_DPI, min_confidence=min_confidence, high_dpi_pages=[])
+        self.stop_event = threading.Event()
+        self.cancelled = False
+        self._loop = None
+        self._task = None
+
+    def run(self):
+        started = time.perf_counter()
+        status = "failed"
+        try:
+            with metrics.span("document", kind="pdf" if self.path.lower().endswith(".pdf") else "image"):
+                summary = asyncio.run(self._run())
+            status = "done"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise PipelineCancelled() from None
+        finally:
+            metrics.event("document", path=self.path, status=status,
+                          seconds=round(time.perf_counter() - started, 6), **self.report)
+        return self.page_texts, summary
+
+    def cancel(self):
+        # Safe from any thread. OCR stops after the page in progress and LLM requests in flight
+        # are abandoned; run() then raises PipelineCancelled.
+        self.cancelled = True
+        self.stop_event.set()
+        if self._task is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            except RuntimeError:
+                # The loop already finished
+                pass
+
+    def _pdf_texts(self, temp_dir, cache):
+        # Pages with an embedded text layer are read directly, only the rest are rasterized and OCR'd
+        self.page_count = get_pdf_page_count(self.path)
+        text_layer = extract_pdf_text_layer(self.path, self.page_count)
+        ocr_page_numbers = [i + 1 for i, text in enumerate(text_layer) if not has_usable_text(text)]
+        with ExitStack() as stack:
+            ocr_texts = iter(())
+            if ocr_page_numbers:
+                # Grayscale pages are rendered one at a time and OCR'd concurrently in memory
+                pool = self.pool or stack.enter_context(
+                    OCRPool(self.ocr_workers, engine=self.ocr_engine, preprocess=self.preprocess)
+                )
+                if self.adaptive_dpi:
+                    ocr_texts = self._adaptive_ocr(pool, ocr_page_numbers, temp_dir, cache)
+                else:
+                    pages = iter_pdf_page_numbers(self.path, ocr_page_numbers, DEFAULT_DPI, grayscale=True)
+                    ocr_texts = pool.ocr_pages_detailed(
+                        pages, temp_dir, cache, self.blank_threshold, page_index=self.page_index
+                    )
+            for page_number, text in enumerate(text_layer, 1):
+                if has_usable_text(text):
+                    self.report["text_layer_pages"] += 1
+                    yield text.strip()
+                    continue
+                text, info = next(ocr_texts)
+                self._record_ocr_page(page_number, info)
+                # Blank pages still yield "" so page numbers stay aligned; chunking skips empty pages
+                yield text
+
+    def _record_ocr_page(self, page_number, info):
+        if info.get("blank"):
+            self._record_blank_page(page_number, info["ink_ratio"])
+            return
+        self.report["ocr_pages"] += 1
+        if info.get("near_duplicate"):
+            self.report["near_duplicate_pages"].append(page_number)
+
+    def _record_blank_page(self, page_number, ratio):
+        self.report["blank_pages"].append(page_number)
+        self.report["blank_ink_ratios"].append(ratio)
+
+    def _adaptive_ocr(self, pool, page_numbers, temp_dir, cache):
+        # Only pages the low-resolution pass read with little confidence (or found no words on) are
+        # rendered again at high resolution. Images have a fixed resolution and always take one pass.
+        # Only the first pass uses the near-duplicate index: the hash does not depend on resolution,
+        # so a high-resolution render would just match its own low-resolution entry.
+        pages = iter_pdf_page_numbers(self.path, page_numbers, LOW_DPI, grayscale=True)
+        first_pass = pool.ocr_pages_detailed(
+            pages, temp_dir, cache, self.blank_threshold, with_confidence=True, page_index=self.page_index
+        )
+        # Re-renders go to the pool without waiting, so the second pass runs alongside the first.
+        # The window keeps pages in order: (page_number, first pass result, submit_page() or None).
+        window = deque()
+        for page_number, (text, info) in zip(page_numbers, first_pass):
+            confidence = info["confidence"]
+            redo = None
+            if not info.get("blank") and (confidence is None or confidence < self.min_confidence):
+                page = next(iter_pdf_page_numbers(self.path, [page_number], HIGH_DPI, grayscale=True))
+                redo = pool.submit_page(page, temp_dir, cache, with_confidence=True)
+            window.append((page_number, (text, info), redo))
+            while window and (len(window) > pool.max_in_flight or window[0][2] is None or window[0][2][0].done()):
+                yield self._adaptive_result(pool, cache, *window.popleft())
+        while window:
+            yield self._adaptive_result(pool, cache, *window.popleft())
+
+    def _adaptive_result(self, pool, cache, page_number, first_pass, redo):
+        if redo is None:
+            return first_pass
+        future, key, info = redo
+        self.report["high_dpi_pages"].append(page_number)
+        return pool.finish_page(future.result(), key, info, cache, with_confidence=True)
+
+    def _ocr_texts(self, temp_dir, cache):
+        if self.path.lower().endswith(".pdf"):
+            yield from self._pdf_texts(temp_dir, cache)
+        else:
+            self.page_count = 1
+            gray_img = to_grayscale(self.path)
+            if self.pool is not None:
+                # Shared pool (batch and service): images get the same blank, cache and near-duplicate
+                # checks as PDF pages
+                text, info = next(self.pool.ocr_pages_detailed(
+                    [gray_img], temp_dir, cache, self.blank_threshold, page_index=self.page_index
+                ))
+                self._record_ocr_page(1, info)
+                yield text
+                return
+            if self.blank_threshold is not None:
+                blank, ratio = is_blank_page(gray_img, self.blank_threshold)
+                if blank:
+                    self._record_blank_page(1, ratio)
+                    yield ""
+                    return
+            self.report["ocr_pages"] += 1
+            if cache is not None:
+                yield extract_text_cached(gray_img, cache, temp_dir, self.ocr_engine, self.preprocess)
+            else:
+                yield extract_text_from_image(gray_img, temp_dir, self.ocr_engine, self.preprocess)
+
+    def _ocr_stage(self, loop, queue):
+        # The cache connection is opened here because SQLite connections belong to one thread
+        cache = ResultCache() if self.use_cache else None
+        try:
+            with job_temp_dir() as temp_dir:
+                for index, text in enumerate(self._ocr_texts(temp_dir, cache)):
+                    loop.call_soon_threadsafe(queue.put_nowait, (index, text))
+                    if self.stop_event.is_set():
+                        break
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+        finally:
+            if cache is not None:
+                cache.close()
+
+    async def _pages(self, queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            index, text = item
+            self.page_texts.append(text)
+            self.report["pages"] = len(self.page_texts)
+            if self.on_page is not None:
+                self.on_page(index, text)
+            if self.on_progress is not None:
+                self.on_progress(index + 1, self.page_count)
+            yield text
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self._loop, self._task = loop, asyncio.current_task()
+        if self.cancelled:
+            raise PipelineCancelled()
+        queue = asyncio.Queue()
+        ocr = loop.run_in_executor(None, self._ocr_stage, loop, queue)
+        if not self.summarize:
+            async for _ in self._pages(queue):
+                pass
+            await ocr
+            return None
+
+        summary_cache = None
+        if self.use_cache:
+            summary_cache = ResultCache(table="summary", max_bytes=SUMMARY_CACHE_MAX_BYTES, ttl=SUMMARY_CACHE_TTL)
+        try:
+            async with AsyncLLMClient(self.api_key, self.organization, rate_limiter=self.rate_limiter) as client:
+                return await summarize_stream(
+                    client, self._pages(queue), summary_cache, self.refresh_summary, self.on_summary_delta
+                )
+        finally:
+            # Let the OCR thread wind down before the loop closes, also when summarization failed
+            self.stop_event.set()
+            await ocr
+            if summary_cache is not None:
+                summary_cache.close()
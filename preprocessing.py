@@ -0,0 +1,214 @@
+"""
+    In-memory page preprocessing ahead of Tesseract, built from vectorized OpenCV/NumPy operations:
+    deskew, margin cropping, downscaling to a target x-height and adaptive thresholding.
+
+    Compare per-page OCR time and output against the plain grayscale path (ground truth is read from a
+    .txt file next to each image when present):
+
+    python preprocessing.py page1.png page2.png --preset standard
+"""
+import argparse
+import difflib
+import os
+import time
+from startup import LazyModule
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+class PreprocessConfig:
+    def __init__(self, deskew=False, max_skew=10.0, skew_step=0.25, crop_margins=False, margin=16,
+                 target_x_height=None, adaptive_threshold=False, block_size=31, threshold_c=15):
+        self.deskew = deskew
+        self.max_skew = max_skew
+        self.skew_step = skew_step
+        self.crop_margins = crop_margins
+        self.margin = margin
+        self.target_x_height = target_x_height
+        self.adaptive_threshold = adaptive_threshold
+        self.block_size = block_size
+        self.threshold_c = threshold_c
+
+    def key(self):
+        # Part of the OCR cache key: different settings give different text for the same pixels
+        return ",".join(f"{name}={value}" for name, value in sorted(vars(self).items()))
+
+PRESETS = {
+    "grayscale": PreprocessConfig(),
+    "standard": PreprocessConfig(deskew=True, crop_margins=True, target_x_height=20, adaptive_threshold=True),
+}
+
+def get_preprocess_config(preset):
+    if isinstance(preset, PreprocessConfig):
+        return preset
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown preprocessing preset: {preset}")
+    return PRESETS[preset]
+
+def _downsample(gray_img, max_side=1000):
+    scale = min(1.0, max_side / max(gray_img.shape))
+    if scale == 1.0:
+        return gray_img, 1.0
+    return cv2.resize(gray_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+
+def ink_mask(gray_img):
+    # Otsu picks the ink/paper split per page; ink becomes True
+    _, binary = cv2.threshold(gray_img, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return binary > 0
+
+def _best_angle(ys, xs, angles, offset):
+    scores = np.empty(len(angles))
+    for i, tangent in enumerate(np.tan(np.radians(angles))):
+        rows = np.round(ys - xs * tangent).astype(np.int64) + offset
+        scores[i] = np.square(np.bincount(rows).astype(np.float64)).sum()
+    return float(angles[int(np.argmax(scores))])
+
+def estimate_skew(gray_img, max_skew=10.0, step=0.25):
+    # Projection profile: at the right angle the ink of each text line falls into the same rows,
+    # which maximizes the sum of squared row counts. All ink points are projected per angle at once,
+    # first in whole degrees, then in `step` increments around the best one.
+    small, _ = _downsample(gray_img)
+    ys, xs = np.nonzero(ink_mask(small))
+    if len(ys) < 100:
+        return 0.0
+    offset = int(np.ceil(small.shape[1] * np.tan(np.radians(max_skew)))) + 1
+    coarse = _best_angle(ys, xs, np.arange(-max_skew, max_skew + 0.5, 1.0), offset)
+    fine = np.arange(max(-max_skew, coarse - 1), min(max_skew, coarse + 1) + step / 2, step)
+    return _best_angle(ys, xs, fine, offset)
+
+def rotate(gray_img, angle):
+    height, width = gray_img.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(gray_img, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=255)
+
+def crop_margins(gray_img, margin=16):
+    # Rows/columns that are almost fully dark are scanner borders, not content
+    mask = ink_mask(gray_img)
+    row_ink = mask.sum(axis=1)
+    col_ink = mask.sum(axis=0)
+    rows = np.nonzero((row_ink > 0) & (row_ink < 0.8 * mask.shape[1]))[0]
+    cols = np.nonzero((col_ink > 0) & (col_ink < 0.8 * mask.shape[0]))[0]
+    if len(rows) == 0 or len(cols) == 0:
+        return gray_img
+    top = max(0, rows[0] - margin)
+    bottom = min(gray_img.shape[0], rows[-1] + margin + 1)
+    left = max(0, cols[0] - margin)
+    right = min(gray_img.shape[1], cols[-1] + margin + 1)
+    return gray_img[top:bottom, left:right]
+
+def estimate_x_height(gray_img):
+    # Median height of letter-sized connected components; lowercase letters dominate running text
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink_mask(gray_img).astype(np.uint8), connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    letters = heights[(heights >= 4) & (heights <= 200) & (widths <= 3 * heights)]
+    if len(letters) < 20:
+        return None
+    return float(np.median(letters))
+
+def rescale_to_x_height(gray_img, target_x_height):
+    # Only downscales: fewer pixels is where the speed comes from, upscaling would not add detail
+    x_height = estimate_x_height(gray_img)
+    if x_height is None:
+        return gray_img
+    scale = target_x_height / x_height
+    if scale >= 0.9:
+        return gray_img
+    return cv2.resize(gray_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+# Pages where less than this share of the (downsampled) pixels is ink are treated as blank. Kept near
+# zero: a lone page number scores about 0.0001, "Appendix A" 0.0005 and one line of text 0.002, and
+# none of those pages may be skipped.
+BLANK_INK_RATIO = 0.00002
+BLANK_INK_CONTRAST = 48
+BLANK_BORDER = 0.03
+# Marks of fewer pixels than this (at 600 px wide, dust and scanner specks) are not counted as ink
+BLANK_MIN_MARK = 3
+
+def ink_ratio(gray_img):
+    # Share of pixels clearly darker than the paper around them. The local background comes from
+    # a wide box blur so uneven lighting does not count as ink, and a thin border is ignored
+    # because scanner edges are dark.
+    small, _ = _downsample(gray_img, 600)
+    background = cv2.blur(small, (41, 41))
+    ink = small.astype(np.int16) < background.astype(np.int16) - BLANK_INK_CONTRAST
+    height, width = ink.shape
+    dy, dx = int(height * BLANK_BORDER), int(width * BLANK_BORDER)
+    ink = ink[dy:height - dy, dx:width - dx]
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink.astype(np.uint8), connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    return float(areas[areas >= BLANK_MIN_MARK].sum()) / ink.size
+
+def is_blank_page(gray_img, threshold=BLANK_INK_RATIO):
+    ratio = ink_ratio(gray_img)
+    return ratio < threshold, ratio
+
+def preprocess_page(gray_img, config):
+    config = get_preprocess_config(config)
+    if config.deskew:
+        angle = estimate_skew(gray_img, config.max_skew, config.skew_step)
+        if abs(angle) >= config.skew_step:
+            gray_img = rotate(gray_img, angle)
+    if config.crop_margins:
+        gray_img = crop_margins(gray_img, config.margin)
+    if config.target_x_height:
+        gray_img = rescale_to_x_height(gray_img, config.target_x_height)
+    if config.adaptive_threshold:
+        gray_img = cv2.adaptiveThreshold(
+            gray_img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, config.block_size, config.threshold_c
+        )
+    return gray_img
+
+def char_accuracy(truth, text):
+    # Whitespace-insensitive similarity of the OCR output to the ground truth, 1.0 is a perfect match
+    truth = " ".join(truth.split())
+    text = " ".join(text.split())
+    if not truth:
+        return 1.0 if not text else 0.0
+    return difflib.SequenceMatcher(None, truth, text, autojunk=False).ratio()
+
+def benchmark(image_paths, preset, engine="auto"):
+    from utils import extract_text_from_image, job_temp_dir, to_grayscale
+    rows = []
+    with job_temp_dir() as temp_dir:
+        for path in image_paths:
+            gray_img = to_grayscale(path)
+            truth_path = os.path.splitext(path)[0] + ".txt"
+            truth = None
+            if os.path.exists(truth_path):
+                with open(truth_path, "r", encoding="utf-8") as f:
+                    truth = f.read()
+            row = {"path": path}
+            for name in ("grayscale", preset):
+                started = time.perf_counter()
+                text = extract_text_from_image(gray_img, temp_dir, engine, name)
+                row[f"{name}_ms"] = (time.perf_counter() - started) * 1000
+                row[f"{name}_chars"] = len(text)
+                if truth is not None:
+                    row[f"{name}_accuracy"] = char_accuracy(truth, text)
+            started = time.perf_counter()
+            preprocess_page(gray_img, preset)
+            row["preprocess_ms"] = (time.perf_counter() - started) * 1000
+            rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR time and quality with and without preprocessing")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--preset", default="standard", choices=sorted(PRESETS))
+    parser.add_argument("--engine", default="auto")
+    args = parser.parse_args()
+
+    rows = benchmark(args.images, args.preset, args.engine)
+    for row in rows:
+        line = (f"{row['path']}: preprocess {row['preprocess_ms']:.1f} ms, "
+                f"grayscale {row['grayscale_ms']:.0f} ms, {args.preset} {row[f'{args.preset}_ms']:.0f} ms")
+        if "grayscale_accuracy" in row:
+            line += f", accuracy {row['grayscale_accuracy']:.3f} -> {row[f'{args.preset}_accuracy']:.3f}"
+        print(line)
+    total_before = sum(row["grayscale_ms"] for row in rows)
+    total_after = sum(row[f"{args.preset}_ms"] for row in rows)
+    print(f"Total OCR time: grayscale {total_before:.0f} ms, {args.preset} {total_after:.0f} ms")
+
+if __name__ == "__main__":
+    main()
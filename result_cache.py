@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import metrics
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Least recently used rows looked at per eviction query
+EVICT_BATCH = 256
+
+def default_cache_path():
+    return os.path.join(os.path.expanduser("~"), "Documents", "openai_ocr", "cache.sqlite3")
+
+def ocr_cache_key(gray_img, config_key):
+    # Same pixels under the same engine/language/PSM/OEM/preprocessing always give the same text
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(config_key.encode())
+    digest.update(str(gray_img.shape).encode())
+    digest.update(gray_img.tobytes())
+    return digest.hexdigest()
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+def summary_cache_key(text, prompt_template, model, params):
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(json.dumps([prompt_template, model, params], sort_keys=True).encode())
+    digest.update(normalize_text(text).encode())
+    return digest.hexdigest()
+
+class ResultCache:
+    # SQLite-backed key/value store, evicting least recently used entries above max_bytes
+    # and, when ttl is set, entries older than ttl seconds
+    def __init__(self, path=None, table="ocr", max_bytes=DEFAULT_MAX_BYTES, ttl=None):
+        self.path = path or default_cache_path()
+        self.table = table
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed)")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_created ON {table}(created)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+            # Running total of value sizes, kept by triggers so every connection and process sees it
+            # and put() never has to sum the table. Seeded once for caches created before it existed.
+            self.conn.execute(
+                f"INSERT OR IGNORE INTO cache_stats (name, count) SELECT '{table}_bytes', COALESCE(SUM(size), 0) FROM {table}"
+            )
+            for event, change in (("INSERT", "new.size"), ("DELETE", "-old.size"), ("UPDATE", "new.size - old.size")):
+                self.conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {table}_bytes_{event.lower()} AFTER {event} ON {table} BEGIN "
+                    f"UPDATE cache_stats SET count = count + {change} WHERE name = '{table}_bytes'; END"
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._save_stats()
+        self.conn.close()
+
+    def get(self, key):
+        row = self.conn.execute(f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is not None and self.ttl is not None and row[1] < time.time() - self.ttl:
+            with self.conn:
+                self.conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            self.misses += 1
+            metrics.inc("cache_lookups", table=self.table, result="miss")
+            return None
+        with self.conn:
+            self.conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        metrics.inc("cache_lookups", table=self.table, result="hit")
+        return row[0]
+
+    def put(self, key, value):
+        now = time.time()
+        with self.conn:
+            # An upsert rather than INSERT OR REPLACE: REPLACE deletes without firing the size triggers
+            self.conn.execute(
+                f"INSERT INTO {self.table} (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "created = excluded.created, accessed = excluded.accessed",
+                (key, value, len(value.encode()), now, now),
+            )
+            self._evict()
+
+    def total_bytes(self):
+        row = self.conn.execute("SELECT count FROM cache_stats WHERE name = ?", (f"{self.table}_bytes",)).fetchone()
+        return row[0] if row is not None else 0
+
+    def _evict(self):
+        if self.ttl is not None:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.ttl,))
+        # Under the cap (almost every put) this is one primary key lookup. Over it, the least recently
+        # used entries go, read off the accessed index a batch at a time.
+        excess = self.total_bytes() - self.max_bytes
+        while excess > 0:
+            rows = self.conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY accessed LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            self.conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", evicted)
+
+    def _save_stats(self):
+        with self.conn:
+            for name, count in ((f"{self.table}_hits", self.hits), (f"{self.table}_misses", self.misses)):
+                self.conn.execute(
+                    "INSERT INTO cache_stats (name, count) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET count = count + excluded.count",
+                    (name, count),
+                )
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        totals = dict(self.conn.execute(
+            "SELECT name, count FROM cache_stats WHERE name IN (?, ?)",
+            (f"{self.table}_hits", f"{self.table}_misses"),
+        ).fetchall())
+        entries = self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        size = self.total_bytes()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": totals.get(f"{self.table}_hits", 0) + self.hits,
+            "total_misses": totals.get(f"{self.table}_misses", 0) + self.misses,
+            "entries": entries,
+            "bytes": size,
+        }
@@ -0,0 +1,193 @@
+"""
+    Searchable store of processed documents: per-page text, summary, thumbnail and job report in one
+    SQLite database with an FTS5 index over page text and summaries.
+
+    python result_store.py search "invoice AND 2023"
+    python result_store.py show 42
+    python result_store.py recent
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import metrics
+
+def default_store_path():
+    return os.path.join(os.path.expanduser("~"), "Documents", "openai_ocr", "results.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created REAL NOT NULL,
+    page_count INTEGER NOT NULL,
+    summary TEXT,
+    report TEXT,
+    thumbnail BLOB
+);
+CREATE INDEX IF NOT EXISTS documents_created ON documents(created);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    page_number INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (document_id, page_number)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(text, content='pages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS pages_fts_insert AFTER INSERT ON pages BEGIN
+    INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS pages_fts_delete AFTER DELETE ON pages BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS summaries_fts USING fts5(summary, content='documents', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS summaries_fts_insert AFTER INSERT ON documents BEGIN
+    INSERT INTO summaries_fts (rowid, summary) VALUES (new.id, COALESCE(new.summary, ''));
+END;
+CREATE TRIGGER IF NOT EXISTS summaries_fts_delete AFTER DELETE ON documents BEGIN
+    INSERT INTO summaries_fts (summaries_fts, rowid, summary) VALUES ('delete', old.id, COALESCE(old.summary, ''));
+END;
+"""
+
+class ResultStore:
+    # One connection per thread, like ResultCache. A document and all its pages are written in a
+    # single transaction, so a search never sees half a document.
+    def __init__(self, path=None):
+        self.path = path or default_store_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def save_document(self, path, page_texts, summary=None, report=None, thumbnail=None):
+        with metrics.span("persist"), self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO documents (path, name, created, page_count, summary, report, thumbnail) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, os.path.basename(path), time.time(), len(page_texts), summary,
+                 json.dumps(report) if report is not None else None, thumbnail),
+            )
+            document_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO pages (document_id, page_number, text) VALUES (?, ?, ?)",
+                [(document_id, number, text) for number, text in enumerate(page_texts, 1)],
+            )
+        return document_id
+
+    def delete_document(self, document_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM pages WHERE document_id = ?", (document_id,))
+            self.conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+
+    def _document(self, row):
+        document = dict(row)
+        if document.get("report"):
+            document["report"] = json.loads(document["report"])
+        return document
+
+    def get_document(self, document_id, with_pages=True):
+        row = self.conn.execute(
+            "SELECT id, path, name, created, page_count, summary, report FROM documents WHERE id = ?",
+            (document_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        document = self._document(row)
+        if with_pages:
+            document["pages"] = [text for (text,) in self.conn.execute(
+                "SELECT text FROM pages WHERE document_id = ? ORDER BY page_number", (document_id,)
+            )]
+        return document
+
+    def thumbnail(self, document_id):
+        row = self.conn.execute("SELECT thumbnail FROM documents WHERE id = ?", (document_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def recent_documents(self, limit=20):
+        rows = self.conn.execute(
+            "SELECT id, path, name, created, page_count, summary, report FROM documents "
+            "ORDER BY created DESC LIMIT ?",
+            (limit,),
+        )
+        return [self._document(row) for row in rows]
+
+    def search(self, query, limit=20):
+        # FTS5 query syntax (AND/OR/NOT, "phrases", prefix*). Page and summary hits are ranked together
+        # by bm25; summary hits have page_number None.
+        rows = self.conn.execute(
+            "SELECT * FROM ("
+            "SELECT d.id AS document_id, d.name, d.path, d.created, p.page_number, "
+            "snippet(pages_fts, 0, '[', ']', '...', 12) AS snippet, bm25(pages_fts) AS rank "
+            "FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid JOIN documents d ON d.id = p.document_id "
+            "WHERE pages_fts MATCH ? "
+            "UNION ALL "
+            "SELECT d.id, d.name, d.path, d.created, NULL, "
+            "snippet(summaries_fts, 0, '[', ']', '...', 12), bm25(summaries_fts) "
+            "FROM summaries_fts JOIN documents d ON d.id = summaries_fts.rowid "
+            "WHERE summaries_fts MATCH ?"
+            ") ORDER BY rank LIMIT ?",
+            (query, query, limit),
+        )
+        return [dict(row) for row in rows]
+
+def _format_time(created):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(created))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search and show stored OCR results")
+    parser.add_argument("--store", default=None, help="database path, defaults to the one the GUI writes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    search = commands.add_parser("search", help="full-text search over page text and summaries")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=20)
+    show = commands.add_parser("show", help="print a stored document")
+    show.add_argument("document_id", type=int)
+    show.add_argument("--summary-only", action="store_true")
+    recent = commands.add_parser("recent", help="list the latest documents")
+    recent.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with ResultStore(args.store) as store:
+        if args.command == "search":
+            try:
+                hits = store.search(args.query, args.limit)
+            except sqlite3.OperationalError as e:
+                parser.error(f"invalid search query: {e}")
+            for hit in hits:
+                where = f"page {hit['page_number']}" if hit["page_number"] is not None else "summary"
+                print(f"#{hit['document_id']} {hit['name']} ({where}, {_format_time(hit['created'])}): {hit['snippet']}")
+            if not hits:
+                print("No matches")
+        elif args.command == "show":
+            document = store.get_document(args.document_id)
+            if document is None:
+                print(f"No document #{args.document_id}", file=sys.stderr)
+                return 1
+            print(f"#{document['id']} {document['path']} ({_format_time(document['created'])})")
+            print(f"\n{document['summary'] or '(no summary)'}")
+            if not args.summary_only:
+                for number, text in enumerate(document["pages"], 1):
+                    print(f"\n--- Page {number} ---\n{text}")
+        else:
+            for document in store.recent_documents(args.limit):
+                print(f"#{document['id']} {document['name']} {document['page_count']} pages "
+                      f"({_format_time(document['created'])})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
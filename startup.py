@@ -0,0 +1,128 @@
+"""
+    Startup cost: OpenCV, NumPy, pytesseract, pdf2image, tiktoken and aiohttp are imported on first use
+    instead of when the modules using them load, so the window (or a CLI's argument parsing) comes up
+    before any of them. The GUI warms them up on a background thread once its window is shown; set
+    OCRGPT_WARM_UP=0 to skip that.
+
+    Profile what an entry point loads at import time, per package and in total:
+
+    python startup.py ocr_summarizer_app batch_cli
+"""
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+import metrics
+
+# Loaded on first use by the OCR, PDF and LLM paths, in the order the first document needs them
+HEAVY_MODULES = ("numpy", "cv2", "PIL.Image", "pdf2image", "pytesseract", "aiohttp")
+
+IMPORTED_AT = time.perf_counter()
+
+class LazyModule:
+    # Stands in for a module until one of its attributes is used. The module's attributes are then
+    # copied onto the stand-in, so later lookups are plain attribute reads. on_load(module) runs once.
+    def __init__(self, name, on_load=None):
+        self._lazy_name = name
+        self._lazy_on_load = on_load
+
+    def __getattr__(self, attr):
+        # Only reached for names not copied yet; the import lock makes concurrent first uses safe
+        module = importlib.import_module(self._lazy_name)
+        if "_lazy_loaded" not in self.__dict__:
+            if self._lazy_on_load is not None:
+                self._lazy_on_load(module)
+            self.__dict__.update(vars(module))
+            self._lazy_loaded = True
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name!r}>"
+
+def warm_up(modules=HEAVY_MODULES):
+    # Imports the modules now so the first document does not wait for them; returns seconds per module
+    timings = {}
+    for name in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        timings[name] = time.perf_counter() - started
+        metrics.observe("warm_up", timings[name], module=name)
+    return timings
+
+def warm_up_enabled():
+    return os.getenv("OCRGPT_WARM_UP", "1") != "0"
+
+def warm_up_in_background(modules=HEAVY_MODULES):
+    thread = threading.Thread(target=warm_up, args=(modules,), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+def record_startup(label):
+    # Time from this module's import (the start of the app's own imports) to label, e.g. "window_shown"
+    seconds = time.perf_counter() - IMPORTED_AT
+    metrics.observe("startup", seconds, point=label)
+    metrics.event("startup", point=label, seconds=round(seconds, 6), loaded=loaded_heavy_modules())
+    return seconds
+
+def import_profile(module):
+    # Imports module in a fresh interpreter with -X importtime. Returns (name, self, cumulative, depth)
+    # rows in microseconds, in the order imports finished.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+def summarize_profile(rows):
+    # Self time summed per top-level package, largest first
+    packages = {}
+    for name, self_us, _, _ in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import-time cost of entry points per package")
+    parser.add_argument("modules", nargs="*", default=["ocr_summarizer_app"], help="modules to import")
+    parser.add_argument("--top", type=int, default=15, help="packages to list per module")
+    args = parser.parse_args(argv)
+
+    status = 0
+    for module in args.modules:
+        try:
+            rows = import_profile(module)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            status = 1
+            continue
+        total = sum(self_us for _, self_us, _, _ in rows)
+        print(f"{module}: {total / 1000:.1f} ms, {len(rows)} modules")
+        for package, self_us in summarize_profile(rows)[:args.top]:
+            print(f"  {package:<28} {self_us / 1000:8.1f} ms  {self_us / total:6.1%}")
+        loaded = {name for name, _, _, _ in rows}
+        heavy = [name for name in HEAVY_MODULES if name in loaded]
+        print(f"  heavy modules loaded at import: {', '.join(heavy) if heavy else 'none'}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
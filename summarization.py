@@ -0,0 +1,175 @@
+import asyncio
+from llm_client import CHARS_PER_TOKEN, AsyncLLMClient, count_tokens
+from result_cache import summary_cache_key
+
+SUMMARY_ENGINE = "text-davinci-003"
+SUMMARY_PROMPT = "Please provide main information of:\n\n{text}\n\nTl;dr:"
+REDUCE_PROMPT = "Combine these partial summaries of one document into a single summary of its main information:\n\n{text}\n\nTl;dr:"
+SUMMARY_PARAMS = {
+    "max_tokens": 200,
+    "n": 1,
+    "stop": None,
+    "temperature": 0.7,
+    "frequency_penalty": 0.0,
+    "presence_penalty": 1.0,
+    "top_p": 1.0,
+}
+
+# text-davinci-003 has a 4097 token context; leave room for the prompt and the 200 token answer
+MAX_CHUNK_TOKENS = 3000
+MAX_CONCURRENT_REQUESTS = 4
+
+def summary_key(text, prompt=SUMMARY_PROMPT):
+    return summary_cache_key(text, prompt, SUMMARY_ENGINE, SUMMARY_PARAMS)
+
+def _pack(pieces, separator, max_tokens):
+    # Greedily joins consecutive pieces while they fit, one token allowed for each separator
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = count_tokens(piece) + 1
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append(separator.join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+def _split_oversized(text, max_tokens):
+    # Paragraphs, then lines, then words, until every piece fits the budget
+    for separator in ("\n\n", "\n", " "):
+        parts = [part.strip() for part in text.split(separator) if part.strip()]
+        if len(parts) > 1:
+            pieces = []
+            for part in parts:
+                if count_tokens(part) + 1 > max_tokens:
+                    pieces.extend(_split_oversized(part, max_tokens))
+                else:
+                    pieces.append(part)
+            return _pack(pieces, separator, max_tokens)
+    # A single unbroken run of characters, cut it by length
+    size = int(max_tokens * CHARS_PER_TOKEN)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+class ChunkAccumulator:
+    # Incremental split_into_chunks: pages go in, chunks come out as soon as they are full
+    def __init__(self, max_tokens=MAX_CHUNK_TOKENS):
+        self.max_tokens = max_tokens
+        self.current = []
+        self.current_tokens = 0
+
+    def _flush(self):
+        chunk = "\n\n".join(self.current)
+        self.current = []
+        self.current_tokens = 0
+        return chunk
+
+    def add(self, page):
+        # Whole pages are packed together; only pages over the budget are split on paragraphs
+        page = page.strip()
+        if not page:
+            return []
+        if count_tokens(page) + 1 > self.max_tokens:
+            pieces = _split_oversized(page, self.max_tokens)
+        else:
+            pieces = [page]
+        chunks = []
+        for piece in pieces:
+            piece_tokens = count_tokens(piece) + 1
+            if self.current and self.current_tokens + piece_tokens > self.max_tokens:
+                chunks.append(self._flush())
+            self.current.append(piece)
+            self.current_tokens += piece_tokens
+        return chunks
+
+    def finish(self):
+        return [self._flush()] if self.current else []
+
+def split_into_chunks(pages, max_tokens=MAX_CHUNK_TOKENS):
+    accumulator = ChunkAccumulator(max_tokens)
+    chunks = []
+    for page in pages:
+        chunks.extend(accumulator.add(page))
+    return chunks + accumulator.finish()
+
+async def generate_summary(client, text, cache=None, refresh=False, prompt=SUMMARY_PROMPT, on_delta=None):
+    # With refresh the cached answer is ignored but the fresh one still replaces it
+    if cache is not None:
+        key = summary_key(text, prompt)
+        if not refresh:
+            summary = cache.get(key)
+            if summary is not None:
+                if on_delta is not None:
+                    on_delta(summary)
+                return summary
+
+    if on_delta is None:
+        summary = await client.complete(prompt.format(text=text), SUMMARY_ENGINE, **SUMMARY_PARAMS)
+    else:
+        fragments = []
+        async for fragment in client.stream_complete(prompt.format(text=text), SUMMARY_ENGINE, **SUMMARY_PARAMS):
+            fragments.append(fragment)
+            on_delta(fragment)
+        summary = "".join(fragments).strip()
+    if cache is not None:
+        cache.put(key, summary)
+    return summary
+
+async def summarize_stream(client, pages, cache=None, refresh=False, on_delta=None,
+                           max_chunk_tokens=MAX_CHUNK_TOKENS, max_concurrency=MAX_CONCURRENT_REQUESTS):
+    # `pages` is an async iterable; each chunk is sent off as soon as it is full, while later
+    # pages are still arriving. Only the final answer is streamed through on_delta.
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def summarize(text, prompt):
+        async with semaphore:
+            return await generate_summary(client, text, cache, refresh, prompt)
+
+    accumulator = ChunkAccumulator(max_chunk_tokens)
+    page_texts = []
+    tasks = []
+    try:
+        async for page in pages:
+            page_texts.append(page)
+            for chunk in accumulator.add(page):
+                tasks.append(asyncio.ensure_future(summarize(chunk, SUMMARY_PROMPT)))
+        last_chunks = accumulator.finish()
+        if not tasks:
+            # Blank or empty pages only: there is nothing to send
+            if not last_chunks:
+                return ""
+            return await generate_summary(client, "\n".join(page_texts), cache, refresh, on_delta=on_delta)
+
+        # Map: the remaining chunk joins the ones already in flight
+        tasks.extend(asyncio.ensure_future(summarize(chunk, SUMMARY_PROMPT)) for chunk in last_chunks)
+        summaries = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    # Reduce: combine the partial summaries, in several rounds if they still do not fit. Empty
+    # summaries are dropped when packing; when nothing is left there is nothing to combine.
+    while True:
+        chunks = split_into_chunks(summaries, max_chunk_tokens)
+        if not chunks:
+            return ""
+        if len(chunks) == 1:
+            return await generate_summary(client, chunks[0], cache, refresh, REDUCE_PROMPT, on_delta)
+        summaries = await asyncio.gather(*(summarize(chunk, REDUCE_PROMPT) for chunk in chunks))
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+async def summarize_document_async(client, pages, cache=None, refresh=False, on_delta=None, **kwargs):
+    return await summarize_stream(client, _iterate(pages), cache, refresh, on_delta, **kwargs)
+
+def summarize_document(pages, api_key, organization=None, cache=None, refresh=False, **kwargs):
+    async def run():
+        async with AsyncLLMClient(api_key, organization) as client:
+            return await summarize_document_async(client, pages, cache, refresh, **kwargs)
+    return asyncio.run(run())
@@ -1,37 +1,65 @@
 from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
-from utils import extract_text_from_image, generate_summary
-import time
-import os
+from pipeline import DocumentPipeline, PipelineCancelled
+from result_store import ResultStore
 
 class SummaryWorker(QObject):
+    page_ready = pyqtSignal(int, str)
+    progress = pyqtSignal(int, int)
+    summary_delta = pyqtSignal(str)
     summary_ready = pyqtSignal(str, str)
+    report_ready = pyqtSignal(dict)
+    job_started = pyqtSignal()
+    document_saved = pyqtSignal(int)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
-    def __init__(self, image_path, image_pages):
+    def __init__(self, image_path, api_key, organization=None, ocr_workers=None, ocr_engine="auto",
+                 preprocess="grayscale", use_cache=True, refresh_summary=False, pool=None, thumbnail=None,
+                 rate_limiter=None):
         super().__init__()
         self.image_path = image_path
-        self.image_pages = image_pages
-    
+        # PNG bytes of the preview, stored with the results
+        self.thumbnail = thumbnail
+        self.pipeline = DocumentPipeline(
+            image_path,
+            api_key,
+            organization,
+            ocr_workers,
+            ocr_engine,
+            preprocess,
+            use_cache,
+            refresh_summary,
+            on_page=self.page_ready.emit,
+            on_progress=self.progress.emit,
+            on_summary_delta=self.summary_delta.emit,
+            pool=pool,
+            rate_limiter=rate_limiter,
+        )
+
+    def cancel(self):
+        self.pipeline.cancel()
+
     @pyqtSlot()
     def process_image_and_generate_summary(self):
-        self.timestamp = str(int(time.time()))
-        temp_image_files = []
-        if self.image_path.lower().endswith(".pdf"):    
-            for i, page in enumerate(self.image_pages):
-                temp_filename = f"temp_page_{i}.png"
-                page.save(temp_filename, "PNG")
-                temp_image_files.append(temp_filename)
-            text = "\n".join([extract_text_from_image(temp_file) for temp_file in temp_image_files])
-        else:
-            text = extract_text_from_image(self.image_path)
-            
-        summary = generate_summary(text)
-            
-        # Save OCR text to the openai_ocr folder with a timestamp ID
-        ocr_filename = f"ocr_text_{self.timestamp}.txt"
-        ocr_folder = os.path.join(os.path.expanduser("~"), "Documents", "openai_ocr")
-        os.makedirs(ocr_folder, exist_ok=True)
-        ocr_filepath = os.path.join(ocr_folder, ocr_filename)
-        with open(ocr_filepath, "w") as f:
-            f.write(text)
-        
+        if self.pipeline.cancelled:
+            self.cancelled.emit()
+            return
+        self.job_started.emit()
+        try:
+            page_texts, summary = self.pipeline.run()
+            # Opened on this thread: SQLite connections belong to the thread that created them
+            with ResultStore() as store:
+                document_id = store.save_document(
+                    self.image_path, page_texts, summary, self.pipeline.report, self.thumbnail
+                )
+        except PipelineCancelled:
+            self.cancelled.emit()
+            return
+        except Exception as e:
+            self.failed.emit(f"{type(e).__name__}: {e}")
+            return
+        text = "\n".join(page_texts)
+
+        self.document_saved.emit(document_id)
+        self.report_ready.emit(self.pipeline.report)
         self.summary_ready.emit(text, summary)
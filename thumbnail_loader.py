@@ -0,0 +1,56 @@
+from PyQt6.QtCore import QObject, QBuffer, QByteArray, QIODevice, QSize, Qt, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import QImage, QImageReader
+from utils import render_pdf_thumbnail
+
+THUMBNAIL_SIZE = 400
+
+def pil_to_qimage(image):
+    # Raw pixel copy; the QImage owns its buffer once copy() returns
+    image = image.convert("RGB")
+    width, height = image.size
+    return QImage(image.tobytes(), width, height, 3 * width, QImage.Format.Format_RGB888).copy()
+
+def read_image_thumbnail(path, size=THUMBNAIL_SIZE):
+    # The reader decodes straight to the scaled size, JPEGs skip most of the full-size decode
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    full_size = reader.size()
+    if full_size.isValid():
+        reader.setScaledSize(full_size.scaled(QSize(size, size), Qt.AspectRatioMode.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        raise ValueError(f"Could not read {path}: {reader.errorString()}")
+    return image
+
+def thumbnail_png(image):
+    # Kept with the stored results; cheap at thumbnail size
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "PNG")
+    return bytes(data)
+
+class ThumbnailLoader(QObject):
+    # Builds the preview off the GUI thread. Only QImage is used here, QPixmap belongs to the GUI thread.
+    thumbnail_ready = pyqtSignal(str, QImage, bytes)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    @pyqtSlot()
+    def load(self):
+        try:
+            if self.path.lower().endswith(".pdf"):
+                page = render_pdf_thumbnail(self.path, THUMBNAIL_SIZE)
+                if page is None:
+                    raise ValueError(f"{self.path} has no pages")
+                thumbnail = pil_to_qimage(page)
+            else:
+                thumbnail = read_image_thumbnail(self.path)
+            png = thumbnail_png(thumbnail)
+        except Exception as e:
+            self.failed.emit(self.path, f"{type(e).__name__}: {e}")
+            return
+        self.thumbnail_ready.emit(self.path, thumbnail, png)
@@ -1,36 +1,100 @@
-import cv2
-import pytesseract
-import openai
-from pdf2image import convert_from_path
+import os
+import re
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from ocr_engines import get_engine, set_tesseract_path, get_tesseract_path
+from preprocessing import preprocess_page
+from startup import LazyModule
+import metrics
 
-def set_tesseract_path(path):
-    pytesseract.pytesseract.tesseract_cmd = path
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+pdf2image = LazyModule("pdf2image")
 
-def get_tesseract_path():
-    return pytesseract.pytesseract.tesseract_cmd
+SUPPORTED_EXTENSIONS = (".png", ".xpm", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".pdf")
 
-def convert_pdf_to_images(pdf_path):
-    images = convert_from_path(pdf_path)
-    return images
+def get_pdf_page_count(pdf_path):
+    return pdf2image.pdfinfo_from_path(pdf_path)["Pages"]
 
-def extract_text_from_image(image_path):
-    img = cv2.imread(image_path)
-    gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    text = pytesseract.image_to_string(gray_img)
+def iter_pdf_pages(pdf_path, dpi=200, window=1, first_page=1, last_page=None, grayscale=False):
+    # Render `window` pages per poppler call so only a few pages are in memory at once
+    if last_page is None:
+        last_page = get_pdf_page_count(pdf_path)
+    for start in range(first_page, last_page + 1, window):
+        end = min(start + window - 1, last_page)
+        with metrics.span("rasterize", dpi=dpi):
+            pages = pdf2image.convert_from_path(pdf_path, dpi=dpi, first_page=start, last_page=end, grayscale=grayscale)
+        yield from pages
+
+def render_pdf_thumbnail(pdf_path, size=400):
+    # Poppler renders page 1 straight to fit a size x size box, no full-resolution page is produced
+    pages = pdf2image.convert_from_path(pdf_path, first_page=1, last_page=1, size=size)
+    return pages[0] if pages else None
+
+def iter_pdf_page_numbers(pdf_path, page_numbers, dpi=200, grayscale=False):
+    for page_number in page_numbers:
+        yield from iter_pdf_pages(pdf_path, dpi, first_page=page_number, last_page=page_number, grayscale=grayscale)
+
+# Fewer letters and digits than this on a page means it is a scan (or blank) and goes to OCR
+MIN_TEXT_LAYER_CHARS = 25
+
+def extract_pdf_text_layer(pdf_path, page_count):
+    # One pdftotext run for the whole document; pages come back separated by form feeds
+    try:
+        result = subprocess.run(["pdftotext", "-enc", "UTF-8", pdf_path, "-"], capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return [""] * page_count
+    pages = result.stdout.decode("utf-8", errors="replace").split("\f")[:page_count]
+    return pages + [""] * (page_count - len(pages))
+
+def has_usable_text(text, min_chars=MIN_TEXT_LAYER_CHARS):
+    return len(re.findall(r"\w", text)) >= min_chars
+
+def convert_pdf_to_images(pdf_path, dpi=200):
+    return list(iter_pdf_pages(pdf_path, dpi=dpi))
+
+@contextmanager
+def job_temp_dir():
+    # Private per-job scratch directory, on tmpfs when the system has one
+    base = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+    with tempfile.TemporaryDirectory(prefix="ocrgpt_", dir=base) as temp_dir:
+        yield temp_dir
+
+def to_grayscale(image):
+    # Accepts a file path, a PIL image or a numpy array (OpenCV BGR/BGRA channel order)
+    if isinstance(image, str):
+        return cv2.cvtColor(cv2.imread(image), cv2.COLOR_BGR2GRAY)
+    if not isinstance(image, np.ndarray):
+        if image.mode != "L":
+            image = image.convert("L")
+        return np.asarray(image)
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+def extract_text_from_image(image, temp_dir=None, engine="auto", preprocess="grayscale"):
+    gray_img = to_grayscale(image)
+    if temp_dir is None:
+        with job_temp_dir() as job_dir:
+            return extract_text_from_image(gray_img, job_dir, engine, preprocess)
+    with metrics.span("preprocess"):
+        gray_img = preprocess_page(gray_img, preprocess)
+    ocr_engine = get_engine(engine)
+    with metrics.span("ocr", engine=ocr_engine.name):
+        text = ocr_engine.recognize(gray_img, temp_dir)
     return text.strip()
 
-def generate_summary(text):
-    response = openai.Completion.create(
-        engine="text-davinci-003",
-        prompt=f"Please provide main information of:\n\n{text}\n\nTl;dr:",
-        max_tokens=200,
-        n=1,
-        stop=None,
-        temperature=0.7,
-        frequency_penalty=0.0,
-        presence_penalty=1.0,
-        top_p=1.0,
-    )
-
-    summary = response.choices[0].text.strip()
-    return summary
\ No newline at end of file
+def extract_text_with_confidence(image, temp_dir=None, engine="auto", preprocess="grayscale"):
+    gray_img = to_grayscale(image)
+    if temp_dir is None:
+        with job_temp_dir() as job_dir:
+            return extract_text_with_confidence(gray_img, job_dir, engine, preprocess)
+    with metrics.span("preprocess"):
+        gray_img = preprocess_page(gray_img, preprocess)
+    ocr_engine = get_engine(engine)
+    with metrics.span("ocr", engine=ocr_engine.name):
+        text, confidence = ocr_engine.recognize_with_confidence(gray_img, temp_dir)
+    return text.strip(), confidence